@@ -1,10 +1,12 @@
+import argparse
+import sys
 import gzip
 import shutil
 import xml.etree.ElementTree as ET
 import csv
 import re
-from datetime import datetime
-from textatistic import Textatistic
+from textatistic import (Textatistic, dalechall_score, flesch_score, fleschkincaid_score, gunningfog_score, smog_score,
+                         punct_clean, sent_count, char_count)
 import pycountry
 import glob
 from timeit import default_timer as timer
@@ -12,10 +14,255 @@ from datetime import timedelta
 from numba import jit
 import os
 import time
+import math
+import zlib
+import socket
+import json
+import heapq
+import itertools
+import tempfile
+import random
+import sqlite3
+import io
+import queue
+import threading
+import signal
+import contextlib
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import multiprocessing
+import socketserver
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from array import array
 from vars import georgia_municipalities
 from vars import institutions
 from vars import codes_uppercase
 
+# zstandard is only needed when writing or reading zstd compressed output
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# numpy is optional, it speeds up the MinHash signatures of the duplicate detection stage
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# indexed_gzip is optional, it keeps seek points into the .xml.gz files so the PMID index can read an article
+# without decompressing its file from the start
+try:
+    import indexed_gzip
+except ImportError:
+    indexed_gzip = None
+
+# pandas is only needed to load the output back with loadOutput
+try:
+    import pandas
+except ImportError:
+    pandas = None
+
+# Columns written out to the .tsv files, in output order
+tsvHeader = ['PMID', 'PubDateYear', 'JournalTitle', 'JournalIso', 
+              'ArticleTitle', 'Pagination', 'NumPages', 'Abstract', 'AuthorForeNames', 
+              'AuthorAffiliations', 'GenderFirstAuthor', 'GenderLastAuthor', 'GenderLastCorrespondingAuthor', 
+              'CountryFirstAuthor', 'CountryLastAuthor', 'CountryLastCorrespondingAuthor', 
+              'NumberFemaleAuthors', 'NumberMaleAuthors', 'NumberUnisexAuthor', 
+              'NumberUnknownAuthors', 'FractionFemaleAuthors', 'PublicationType', 
+              'PubMedPubDate(received)', 'PubMedPubDate(accepted)', 'TimeUnderReview(days)', 
+              'DaleChallScore', 'FleschScore', 'FleschKinCaidScore', 'GunningFogScore', 'SmogScore']
+
+# Columns that are only written out when they are selected with --columns
+optionalColumns = ['TimeAcceptedToPubMed(days)', 'NumberOfRevisions',
+                   'AbstractSectionLabels', 'AbstractSectionLengths',
+                   'SectionDaleChallScores', 'SectionFleschScores', 'SectionFleschKinCaidScores',
+                   'SectionGunningFogScores', 'SectionSmogScores', 'ReadabilityStatus']
+
+allColumns = tsvHeader + optionalColumns
+
+# Named groups of columns that can be selected together with --columns
+columnGroups = {
+    'gender': ['GenderFirstAuthor', 'GenderLastAuthor', 'GenderLastCorrespondingAuthor', 'NumberFemaleAuthors',
+               'NumberMaleAuthors', 'NumberUnisexAuthor', 'NumberUnknownAuthors', 'FractionFemaleAuthors'],
+    'country': ['CountryFirstAuthor', 'CountryLastAuthor', 'CountryLastCorrespondingAuthor'],
+    'readability': ['DaleChallScore', 'FleschScore', 'FleschKinCaidScore', 'GunningFogScore', 'SmogScore',
+                    'ReadabilityStatus'],
+    'review': ['PubMedPubDate(received)', 'PubMedPubDate(accepted)', 'TimeUnderReview(days)',
+               'TimeAcceptedToPubMed(days)', 'NumberOfRevisions'],
+    'sections': ['AbstractSectionLabels', 'AbstractSectionLengths'],
+    'sectionReadability': ['SectionDaleChallScores', 'SectionFleschScores', 'SectionFleschKinCaidScores',
+                           'SectionGunningFogScores', 'SectionSmogScores'],
+}
+
+# Extractor of an extra field of the articles, written out to its own optional column. Extractors declare the
+# path of the elements they read (relative to PubmedArticle, like the findtext paths of extractArticle) and
+# value returns the text to keep of such an element, or None to skip it. The values of an article are ';' joined.
+class FieldExtractor:
+
+    def __init__(self, column, path, attribute=None, attributeValue=None):
+        self.column = column
+        self.path = path.split('/')
+        self.attribute = attribute
+        self.attributeValue = attributeValue
+
+    def value(self, element):
+        if self.attribute is not None and element.get(self.attribute) != self.attributeValue:
+            return None
+        return elementText(element) or None
+
+
+# Active field extractors, their columns are added to the optional columns and the 'fields' column group
+fieldExtractors = []
+columnGroups['fields'] = []
+
+
+# Function used to add a field extractor, its column can then be selected with --columns
+def registerFieldExtractor(extractor):
+    if extractor.column in allColumns:
+        raise ValueError("Column already exists: " + extractor.column)
+    fieldExtractors.append(extractor)
+    optionalColumns.append(extractor.column)
+    allColumns.append(extractor.column)
+    columnGroups['fields'].append(extractor.column)
+
+
+registerFieldExtractor(FieldExtractor('MeshHeadings', 'MedlineCitation/MeshHeadingList/MeshHeading/DescriptorName'))
+registerFieldExtractor(FieldExtractor('Keywords', 'MedlineCitation/KeywordList/Keyword'))
+registerFieldExtractor(FieldExtractor('GrantAgencies', 'MedlineCitation/Article/GrantList/Grant/Agency'))
+registerFieldExtractor(FieldExtractor('DOI', 'PubmedData/ArticleIdList/ArticleId', 'IdType', 'doi'))
+
+
+# Function used to merge the paths of the selected field extractors into a tree of {tag: (children, extractors)},
+# so the elements of all of them are found in a single walk that only enters the subtrees on their paths
+def fieldTree(extractors):
+    tree = {}
+    for extractor in extractors:
+        node = tree
+        for depth, tag in enumerate(extractor.path):
+            children, nodeExtractors = node.setdefault(tag, ({}, []))
+            if depth == len(extractor.path) - 1:
+                nodeExtractors.append(extractor)
+            node = children
+    return tree
+
+
+# Function used to walk an article along a field tree, adding the values of every extractor to fields
+def walkFields(element, tree, fields):
+    for child in element:
+        entry = tree.get(child.tag)
+        if entry is None:
+            continue
+        children, extractors = entry
+        for extractor in extractors:
+            value = extractor.value(child)
+            if value is not None:
+                fields.setdefault(extractor.column, []).append(value)
+        if children:
+            walkFields(child, children, fields)
+
+
+# Columns which need the author loop to be run
+authorColumns = set(columnGroups['gender'] + columnGroups['country'] + ['AuthorForeNames', 'AuthorAffiliations'])
+
+
+# Function used to turn a comma separated list of column names and/or group names into the list of output columns
+def selectColumns(columnSpec):
+    if not columnSpec:
+        return list(tsvHeader)
+
+    if isinstance(columnSpec, str):
+        columnSpec = columnSpec.split(',')
+
+    requested = set()
+    for name in columnSpec:
+        name = name.strip()
+        if not name:
+            continue
+        if name in columnGroups:
+            requested.update(columnGroups[name])
+        elif name in allColumns:
+            requested.add(name)
+        else:
+            raise ValueError("Unknown column or column group: " + name)
+
+    # Keep the columns in the same order as the full header
+    return [column for column in allColumns if column in requested]
+
+
+# Numeric columns are kept in typed arrays instead of lists of boxed values
+integerColumns = {'NumPages', 'NumberFemaleAuthors', 'NumberMaleAuthors', 'NumberUnisexAuthor',
+                  'NumberUnknownAuthors', 'TimeUnderReview(days)', 'TimeAcceptedToPubMed(days)',
+                  'NumberOfRevisions'}
+floatColumns = {'FractionFemaleAuthors', 'DaleChallScore', 'FleschScore', 'FleschKinCaidScore',
+                'GunningFogScore', 'SmogScore'}
+
+# Missing values of numeric columns are recorded in a mask, 1 is written out as "NA" and 2 as an empty cell
+missingValues = {"NA": 1, None: 2}
+missingOutput = {1: "NA", 2: None}
+
+# Number of articles enriched together and buffered before they are handed over to the writer
+defaultBatchSize = 5000
+
+
+# Compact struct-of-arrays store for a batch of articles, one entry per selected column
+class ArticleBatch:
+    __slots__ = ('columns', 'values', 'masks', 'size')
+
+    def __init__(self, columns):
+        self.columns = list(columns)
+        self.values = []
+        self.masks = []
+        self.size = 0
+        for column in self.columns:
+            if column in integerColumns:
+                self.values.append(array('q'))
+                self.masks.append(bytearray())
+            elif column in floatColumns:
+                self.values.append(array('d'))
+                self.masks.append(bytearray())
+            else:
+                self.values.append([])
+                self.masks.append(None)
+
+    def __len__(self):
+        return self.size
+
+    # Add one article, given as a list of values in column order
+    def append(self, articleData):
+        for value, values, mask in zip(articleData, self.values, self.masks):
+            if mask is None:
+                values.append(value)
+            elif value is None or value == "NA":
+                values.append(0)
+                mask.append(missingValues[value])
+            else:
+                values.append(value)
+                mask.append(0)
+        self.size += 1
+
+    # Rough number of bytes held by the batch, used to keep buffered articles within a memory budget
+    def approximateSize(self):
+        size = 0
+        for values, mask in zip(self.values, self.masks):
+            if mask is None:
+                for value in values:
+                    size += len(value) + 50 if isinstance(value, str) else 16
+            else:
+                size += values.itemsize * len(values) + len(mask)
+        return size
+
+    # Yield the articles back as lists of values, ready to be written out
+    def rows(self):
+        for i in range(self.size):
+            row = []
+            for values, mask in zip(self.values, self.masks):
+                if mask is None or mask[i] == 0:
+                    row.append(values[i])
+                else:
+                    row.append(missingOutput[mask[i]])
+            yield row
+
+
 # Function used to excract .gz file and copy over to .xml file to be able to parse data
 def extractGzipToXml(gzipFile, xmlFile):
     with gzip.open(gzipFile, 'rb') as fin:
@@ -251,156 +498,743 @@ def ensureProperPunctuation(abstract):
         abstract += '.'
     return abstract
 
-#@jit(nopython = True)
-#def getTextTest(abstract):
-#    return Textatistic(abstract)
+# Month numbers for the month names and abbreviations found in PubMed dates
+monthNumbers = {'jan': 1, 'feb': 2, 'mar': 3, 'apr': 4, 'may': 5, 'jun': 6,
+                'jul': 7, 'aug': 8, 'sep': 9, 'oct': 10, 'nov': 11, 'dec': 12}
 
-# Function used to parse the PubMedArticles
-def parsePubMedArticles(xmlFile):
-    # Parse xml file using ElementTree library
-    tree = ET.parse(xmlFile)
-    root = tree.getroot()
+daysInMonth = [31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
 
-    
-    
-    journalsData = {}
 
+# Function used to convert a date to the number of days since 1970-01-01 using integer arithmetic only
+def epochDay(year, month, day):
+    # Count years from March so the leap day is the last day of the year
+    if month <= 2:
+        year -= 1
+    era = year // 400
+    yearOfEra = year - era * 400
+    dayOfYear = (153 * (month + (9 if month <= 2 else -3)) + 2) // 5 + day - 1
+    dayOfEra = yearOfEra * 365 + yearOfEra // 4 - yearOfEra // 100 + dayOfYear
+    return era * 146097 + dayOfEra - 719468
 
-    # For every article found in the xml file, collect the data we want
-    for article in root.findall('PubmedArticle'):
-        pmid = article.findtext('MedlineCitation/PMID')                                                     #PMID
-        pubDateYear = article.findtext('MedlineCitation/Article/Journal/JournalIssue/PubDate/Year')         #PubDate (Year)
-        journalTitle = article.findtext('MedlineCitation/Article/Journal/Title')                            #Journal Title
-        journalIso = article.findtext('MedlineCitation/Article/Journal/ISOAbbreviation')                    #ISO
-        articleTitle = article.findtext('MedlineCitation/Article/ArticleTitle')                             #Article Title
-        pagination = article.findtext('MedlineCitation/Article/Pagination/MedlinePgn')                      #Pagination
-        numPages = calculatePages(pagination)
 
-        # Concatenate all abstract sections using itertext()
-        abstract_sections = article.findall('MedlineCitation/Article/Abstract/AbstractText')
-        abstract = ' '.join(ET.tostring(section, encoding='unicode', method='text').strip() for section in abstract_sections)
+# Function used to turn the Year, Month and Day of a PubMed date into an epoch day, returns None if it is not a valid date
+def parsePubMedDate(year, month, day):
+    if not year or not year.isdigit() or not month:
+        return None
+    year = int(year)
 
-        if not abstract:
-            abstract = "NA"
+    # Months are either numbers or (abbreviated) month names
+    if month.isdigit():
+        month = int(month)
+    else:
+        month = monthNumbers.get(month[:3].lower())
+        if month is None:
+            return None
+    if month < 1 or month > 12:
+        return None
+
+    # A missing day is taken as the first of the month
+    if not day:
+        day = 1
+    elif day.isdigit():
+        day = int(day)
+    else:
+        return None
+    leapDay = 1 if month == 2 and year % 4 == 0 and (year % 100 != 0 or year % 400 == 0) else 0
+    if day < 1 or day > daysInMonth[month - 1] + leapDay:
+        return None
+
+    return epochDay(year, month, day)
+
+
+# Function used to collect every PubMedPubDate of an article's history in a single pass
+# Returns the raw date strings and epoch days of the first date of each status, and the number of revisions
+def extractHistory(article):
+    history = article.find('PubmedData/History')
+    if history is None:
+        return None, None, None
+
+    rawDates = {}
+    epochDays = {}
+    numberOfRevisions = 0
+    for pubDate in history:
+        status = pubDate.get('PubStatus')
+        if status == 'revised':
+            numberOfRevisions += 1
+        if status in rawDates:
+            continue
+
+        year = month = day = None
+        for part in pubDate:
+            if part.tag == 'Year':
+                year = part.text
+            elif part.tag == 'Month':
+                month = part.text
+            elif part.tag == 'Day':
+                day = part.text
+        rawDates[status] = f"{year}-{month}-{day}"
+        epochDays[status] = parsePubMedDate(year, month, day)
+
+    return rawDates, epochDays, numberOfRevisions
+
+
+# Function used to calculate the number of days between two statuses of an article's history
+def daysBetween(rawDates, epochDays, fromStatus, toStatus):
+    if fromStatus not in rawDates or toStatus not in rawDates:
+        return None
+    if epochDays[fromStatus] is None or epochDays[toStatus] is None:
+        return "NA"
+    return epochDays[toStatus] - epochDays[fromStatus]
 
-        if abstract == "NA":
-            daleChallScore = fleschScore = fleschKinCaidScore = gunningFogScore = smogScore = "NA"
+
+#@jit(nopython = True)
+#def getTextTest(abstract):
+#    return Textatistic(abstract)
+
+# Function used to get the text of an element, including the text of nested markup such as <i> or <sup>,
+# without serializing it
+def elementText(element):
+    return ''.join(element.itertext()).strip()
+
+
+# Function used to calculate the readability scores from Textatistic counts, in tsvHeader order
+def readabilityScores(counts):
+    try:
+        return [dalechall_score(vars=counts), flesch_score(vars=counts), fleschkincaid_score(vars=counts),
+                gunningfog_score(vars=counts), smog_score(vars=counts)]
+    except Exception as e:
+        return ["NA"] * 5
+
+
+# Function used to score every abstract section on its own, every section is tokenized only once. Returns the
+# scores of the sections, the number of sections that could not be scored and the summed counts of the others,
+# from which the whole-abstract scores are derived (see abstractCounts)
+def scoreAbstractSections(sections):
+    sectionScores = []
+    failedSections = 0
+    totals = {}
+    for label, text in sections:
+        if not text:
+            sectionScores.append(["NA"] * 5)
+            continue
+        try:
+            counts = Textatistic(ensureProperPunctuation(text)).counts
+            scores = readabilityScores(counts)
+        except Exception as e:
+            scores = ["NA"] * 5
+        if scores[0] == "NA":
+            failedSections += 1
         else:
-            try:    
-                abstract = ensureProperPunctuation(abstract) 
-                scores = Textatistic(abstract)
-                daleChallScore = scores.dalechall_score
-                fleschScore = scores.flesch_score
-                fleschKinCaidScore = scores.fleschkincaid_score
-                gunningFogScore = scores.gunningfog_score
-                smogScore = scores.smog_score
-            except Exception as e:
-                daleChallScore = fleschScore = fleschKinCaidScore = gunningFogScore = smogScore = "NA"
-                
-                
-
-            
-
-
-
-        #Create list for author forenames, affiliations and gender
-        authorForeNames = []
-        authorAffiliations = []
-        authorGenders = []
-
-        # Initialize author gender counters
-        numberFemaleAuthors = 0
-        numberMaleAuthors = 0
-        numberUnisexAuthors = 0
-        numberUnknownAuthors = 0  
-        fractionFemaleAuthors = "NA"
-        genderFirstAuthor = "NA"
-        genderLastAuthor = "NA"
-        genderLastCorrespondingAuthor = "NA"
-        countryFirstAuthor = "NA"
-        countryLastAuthor = "NA"
-        countryLastCorrespondingAuthor = "NA"
-        
-         # For every author found in the articles, collect forenames and affiliations
-        for idx, author in enumerate(article.findall('MedlineCitation/Article/AuthorList/Author')):
-            foreName = author.findtext('ForeName')
-            affiliation = author.findtext('AffiliationInfo/Affiliation')
+            for key, value in counts.items():
+                totals[key] = totals.get(key, 0) + value
+        sectionScores.append(scores)
+    return sectionScores, failedSections, totals
+
+
+# Function used to turn the summed section counts into the counts of the whole abstract. The word counts add up,
+# but ensureProperPunctuation ends every section with a sentence, so the sentences and characters of the whole
+# abstract are counted again, which is cheap next to tokenizing and hyphenating its words.
+def abstractCounts(abstract, sectionTotals):
+    counts = dict(sectionTotals)
+    text = punct_clean(abstract)
+    counts['sent_count'] = sent_count(text, prepped=True)
+    counts['char_count'] = char_count(text, prepped=True)
+    return counts
+
+
+# Common English words that are rare in other languages, used to recognize English abstracts
+englishStopwords = {'the', 'of', 'and', 'to', 'is', 'was', 'were', 'with', 'for', 'that', 'this', 'these', 'by',
+                    'from', 'are', 'be', 'been', 'as', 'at', 'which', 'or', 'we', 'our', 'than', 'between',
+                    'after', 'have', 'has', 'not', 'it', 'its', 'who', 'during'}
+
+# Common words of the other languages of PubMed abstracts written in the Latin alphabet (French, Spanish,
+# Portuguese, Italian, German, Dutch, Scandinavian, Polish, Czech, Croatian, Hungarian and Turkish). They are
+# matched in lower case only, so abbreviations such as DES or OS are not counted, and words that also occur in
+# English abstracts (et al., per, die, met, von Willebrand, de-, pro-, ...) are left out.
+nonEnglishStopwords = {'le', 'la', 'les', 'des', 'du', 'une', 'dans', 'pour', 'avec', 'sur', 'aux', 'sont', 'ont',
+                       'qui', 'ces', 'été', 'chez', 'cette', 'nous', 'los', 'las', 'que', 'con', 'por', 'una', 'fue',
+                       'como', 'más', 'entre', 'dos', 'das', 'uma', 'não', 'foram', 'são', 'pelo', 'pela',
+                       'il', 'della', 'delle', 'nel', 'nella', 'gli', 'sono', 'dei', 'degli', 'che', 'der', 'und',
+                       'mit', 'ist', 'nicht', 'sich', 'bei', 'eine', 'wurde', 'wurden', 'für', 'auf', 'nach', 'dem',
+                       'zu', 'het', 'een', 'van', 'zijn', 'werd', 'voor', 'niet', 'bij', 'ook', 'naar', 'worden',
+                       'og', 'och', 'av', 'som', 'til', 'att', 'ett', 'ikke', 'inte', 'oraz', 'jest', 'przez', 'się',
+                       'lub', 'dla', 'są', 'je', 'byl', 'byla', 'jsou', 'nebo', 'při', 'které', 'su', 'od',
+                       'za', 'kod', 'az', 'egy', 'és', 'hogy', 'nem', 'volt', 'között', 've', 'bir', 'bu', 'ile',
+                       'için', 'olarak', 'daha', 'olan'}
+
+# Minimum share of English stopwords among the words of an English abstract, English abstracts are usually above 0.3
+englishStopwordShare = 0.15
+
+
+# Function used to tell if an abstract is English before paying for its readability scores
+# Abstracts of articles written in English are taken as English, abstracts of other articles are often English
+# translations so their words are checked, only the first 300 words are looked at
+def isEnglishAbstract(languages, abstract):
+    if 'eng' in languages:
+        return True
+    words = re.findall(r"[^\W\d_]+", abstract)[:300]
+    if not words:
+        return True
+    if sum(1 for word in words if not word.isascii()) * 2 > len(words):
+        return False
+    englishWords = sum(1 for word in words if word.lower() in englishStopwords)
+    otherWords = sum(1 for word in words if word in nonEnglishStopwords)
+    # An abstract with more stopwords of another language than English ones is not English
+    if otherWords > englishWords:
+        return False
+    if englishWords >= englishStopwordShare * len(words):
+        return True
+    # Terse (e.g. structured) English abstracts have few stopwords, they pass when no other language shows up either
+    return otherWords == 0
+
+
+# Function used to add the ReadabilityStatus column to selected columns with readability scores. Scores of
+# non-English, failed and over budget abstracts are all NA, only the status tells them apart.
+def withReadabilityStatus(columns):
+    needs = columnNeeds(columns)
+    if (needs['readability'] or needs['sectionReadability']) and 'ReadabilityStatus' not in columns:
+        return selectColumns(columns + ['ReadabilityStatus'])
+    return columns
+
+
+# Function used to work out which parts of the extraction and enrichment are needed for the selected columns
+def columnNeeds(columns):
+    requested = set(columns)
+    needs = {
+        'readability': not requested.isdisjoint(columnGroups['readability']),
+        'authors': not requested.isdisjoint(authorColumns),
+        'gender': not requested.isdisjoint(columnGroups['gender']),
+        'country': not requested.isdisjoint(columnGroups['country']),
+        'review': not requested.isdisjoint(columnGroups['review']),
+        'sections': not requested.isdisjoint(columnGroups['sections']),
+        'sectionReadability': not requested.isdisjoint(columnGroups['sectionReadability']),
+    }
+    needs['fields'] = fieldTree([extractor for extractor in fieldExtractors if extractor.column in requested])
+    needs['abstract'] = needs['readability'] or needs['sections'] or needs['sectionReadability'] or 'Abstract' in requested
+    return needs
+
+
+# Function used to collect the raw fields of a PubmedArticle element, the derived columns are computed by enrichArticle
+def extractArticle(article, needs):
+    raw = {
+        'pmid': article.findtext('MedlineCitation/PMID'),                                                   #PMID
+        'pubDateYear': article.findtext('MedlineCitation/Article/Journal/JournalIssue/PubDate/Year'),       #PubDate (Year)
+        'journalTitle': article.findtext('MedlineCitation/Article/Journal/Title'),                          #Journal Title
+        'journalIso': article.findtext('MedlineCitation/Article/Journal/ISOAbbreviation'),                  #ISO
+        'articleTitle': article.findtext('MedlineCitation/Article/ArticleTitle'),                           #Article Title
+        'pagination': article.findtext('MedlineCitation/Article/Pagination/MedlinePgn'),                    #Pagination
+        'pubType': article.findtext('MedlineCitation/Article/PublicationTypeList/PublicationType'),         #Publication Type
+        'abstract': "NA",
+        'abstractSections': [],
+        'authors': [],
+        'history': None,
+        'languages': [],
+        'english': True,
+        'fields': {},
+        'overBudget': [],
+        'timeSpent': 0.0,
+    }
+
+    if needs['fields']:
+        walkFields(article, needs['fields'], raw['fields'])
+
+    if needs['abstract']:
+        # Collect the label and text of every abstract section, then concatenate the sections
+        for section in article.iterfind('MedlineCitation/Article/Abstract/AbstractText'):
+            raw['abstractSections'].append((section.get('Label'), elementText(section)))
+        abstract = ' '.join(text for label, text in raw['abstractSections'])
+        if abstract:
+            raw['abstract'] = abstract
+            raw['languages'] = [language.text for language in article.iterfind('MedlineCitation/Article/Language')]
+            if needs['readability'] or needs['sectionReadability']:
+                raw['english'] = isEnglishAbstract(raw['languages'], abstract)
+
+    if needs['authors']:
+        # For every author found in the articles, collect forenames and affiliations
+        for author in article.findall('MedlineCitation/Article/AuthorList/Author'):
+            raw['authors'].append((author.findtext('ForeName'), author.findtext('AffiliationInfo/Affiliation')))
+
+    if needs['review']:
+        # PubMed history dates (received, revised, accepted, pubmed, medline, entrez, ...)
+        raw['history'] = extractHistory(article)
+
+    return raw
+
+
+# Marker of the string columns of a stage that was abandoned because it ran over its time budget
+overBudgetMarker = "OverBudget"
+
+
+# Raised when a stage runs over its time budget. It derives from BaseException so that the broad
+# "except Exception" around the readability scores does not swallow it.
+class BudgetExceeded(BaseException):
+    pass
+
+
+def raiseBudgetExceeded(signum, frame):
+    raise BudgetExceeded()
+
+
+# Time budget of the slow stages of an article (author classification and readability scores), in seconds.
+# A stage may take at most stageSeconds and all the stages of an article together at most articleSeconds.
+# In the main thread a stage running over is interrupted with a timer signal, elsewhere it is only marked
+# over budget once it returns.
+class TimeBudget:
+
+    def __init__(self, stageSeconds=None, articleSeconds=None):
+        self.stageSeconds = stageSeconds
+        self.articleSeconds = articleSeconds
+
+    @contextlib.contextmanager
+    def stage(self, raw):
+        limit = self.stageSeconds
+        if self.articleSeconds is not None:
+            remaining = self.articleSeconds - raw['timeSpent']
+            limit = remaining if limit is None else min(limit, remaining)
+        if limit is None:
+            yield
+            return
+        if limit <= 0:
+            raise BudgetExceeded()
+
+        useTimer = hasattr(signal, 'setitimer') and threading.current_thread() is threading.main_thread()
+        if useTimer:
+            previousHandler = signal.signal(signal.SIGALRM, raiseBudgetExceeded)
+        start = time.perf_counter()
+        try:
+            if useTimer:
+                signal.setitimer(signal.ITIMER_REAL, limit)
+            yield
+        finally:
+            # The alarm can still go off while the timer is being stopped, the handler is restored regardless
+            try:
+                if useTimer:
+                    try:
+                        signal.setitimer(signal.ITIMER_REAL, 0)
+                    finally:
+                        signal.signal(signal.SIGALRM, previousHandler)
+            finally:
+                raw['timeSpent'] += time.perf_counter() - start
+        if time.perf_counter() - start > limit:
+            raise BudgetExceeded()
+
+
+# Function used to run a stage of an article within the time budget, if there is one
+def budgetStage(budget, raw):
+    if budget is None:
+        return contextlib.nullcontext()
+    return budget.stage(raw)
+
+
+# Function used to classify every unique author forename and affiliation of a batch of extracted articles once
+def classifyAuthors(rawArticles, needs, stats=None, budget=None):
+    genders = {}
+    countries = {}
+    numberOfNames = 0
+    numberOfAffiliations = 0
+
+    # Collect the unique values, only authors with a forename are classified
+    for raw in rawArticles:
+        for foreName, affiliation in raw['authors']:
             if foreName:
-                authorForeNames.append(foreName)
-                gender = determineGender(foreName)
-                authorGenders.append(gender)
-                country = findCountry(affiliation)
-                if idx == 0:
-                    genderFirstAuthor = gender
-                    countryFirstAuthor = country
-                if idx == len(article.findall('MedlineCitation/Article/AuthorList/Author')) - 1:
-                    genderLastAuthor = gender
-                    countryLastAuthor = country
-                if "@" in (affiliation or ""):
-                    genderLastCorrespondingAuthor = gender
-                    countryLastCorrespondingAuthor = country
-
-                if gender == "F":
-                    numberFemaleAuthors += 1
-                elif gender == "M":
-                    numberMaleAuthors += 1
-                elif gender == "U":
-                    numberUnisexAuthors += 1
-                else:
-                    numberUnknownAuthors += 1
+                if needs['gender']:
+                    genders[foreName] = None
+                    numberOfNames += 1
+                if needs['country']:
+                    countries[affiliation] = None
+                    numberOfAffiliations += 1
+
+    t1 = time.perf_counter()
+    if budget is None:
+        for foreName in genders:
+            genders[foreName] = determineGender(foreName)
+        t2 = time.perf_counter()
+        for affiliation in countries:
+            countries[affiliation] = findCountry(affiliation)
+        t3 = time.perf_counter()
+    else:
+        # With a time budget the values are classified article by article, so an article running over its
+        # budget only loses its own classifications
+        genderTime = countryTime = 0.0
+        for raw in rawArticles:
+            try:
+                with budgetStage(budget, raw):
+                    for foreName, affiliation in raw['authors']:
+                        if foreName and needs['gender'] and genders[foreName] is None:
+                            tValue = time.perf_counter()
+                            genders[foreName] = determineGender(foreName)
+                            genderTime += time.perf_counter() - tValue
+                        if foreName and needs['country'] and countries[affiliation] is None:
+                            tValue = time.perf_counter()
+                            countries[affiliation] = findCountry(affiliation)
+                            countryTime += time.perf_counter() - tValue
+            except BudgetExceeded:
+                raw['overBudget'].append('authors')
+        t2 = t1 + genderTime
+        t3 = t2 + countryTime
+
+    if stats is not None:
+        stats['authorNames'] += numberOfNames
+        stats['uniqueAuthorNames'] += len(genders)
+        stats['affiliations'] += numberOfAffiliations
+        stats['uniqueAffiliations'] += len(countries)
+        stats['genderTime'] += t2 - t1
+        stats['countryTime'] += t3 - t2
+
+    return genders, countries
+
+
+# Function used to compute the full row of output columns of an extracted article
+# genders and countries map forenames and affiliations to their classification, see classifyAuthors
+def enrichArticle(raw, needs, genders, countries, budget=None):
+    pagination = raw['pagination']
+    numPages = calculatePages(pagination)
+
+    abstract = raw['abstract']
+    daleChallScore = fleschScore = fleschKinCaidScore = gunningFogScore = smogScore = "NA"
+    readabilityStatus = "NA"
+
+    # Only the scoring of an abstract counts against the time budget
+    scoring = (needs['readability'] or needs['sectionReadability']) and abstract != "NA"
+
+    sectionScores = None
+    try:
+        with budgetStage(budget if scoring else None, raw):
+            if (needs['readability'] or needs['sectionReadability']) and abstract != "NA" and not raw['english']:
+                # English readability formulas are meaningless on other languages, the scores are left out
+                readabilityStatus = "NonEnglish"
+            elif scoring:
+                abstract = ensureProperPunctuation(abstract)
+                failedSections = 0
+                sectionTotals = None
+                if needs['sectionReadability']:
+                    sectionScores, failedSections, sectionTotals = scoreAbstractSections(raw['abstractSections'])
+                if needs['readability']:
+                    try:
+                        if sectionTotals and not failedSections:
+                            # Derived from the sections, so the abstract is not tokenized a second time
+                            scores = readabilityScores(abstractCounts(abstract, sectionTotals))
+                        else:
+                            textScores = Textatistic(abstract)
+                            scores = [textScores.dalechall_score, textScores.flesch_score,
+                                      textScores.fleschkincaid_score, textScores.gunningfog_score,
+                                      textScores.smog_score]
+                        daleChallScore, fleschScore, fleschKinCaidScore, gunningFogScore, smogScore = scores
+                        readabilityStatus = "Scored" if daleChallScore != "NA" else "Failed"
+                    except Exception as e:
+                        daleChallScore = fleschScore = fleschKinCaidScore = gunningFogScore = smogScore = "NA"
+                        readabilityStatus = "Failed"
+                if needs['sectionReadability']:
+                    # Sections that could not be scored are marked, the whole-abstract scores are kept
+                    if failedSections and readabilityStatus != "Failed":
+                        readabilityStatus = "PartiallyScored"
+                    elif not needs['readability']:
+                        readabilityStatus = "Scored"
+    except BudgetExceeded:
+        daleChallScore = fleschScore = fleschKinCaidScore = gunningFogScore = smogScore = "NA"
+        sectionScores = None
+        readabilityStatus = overBudgetMarker
+        raw['overBudget'].append('readability')
+
+
+    #Create list for author forenames, affiliations and gender
+    authorForeNames = []
+    authorAffiliations = []
+
+    # Initialize author gender counters
+    numberFemaleAuthors = 0
+    numberMaleAuthors = 0
+    numberUnisexAuthors = 0
+    numberUnknownAuthors = 0  
+    fractionFemaleAuthors = "NA"
+    genderFirstAuthor = "NA"
+    genderLastAuthor = "NA"
+    genderLastCorrespondingAuthor = "NA"
+    countryFirstAuthor = "NA"
+    countryLastAuthor = "NA"
+    countryLastCorrespondingAuthor = "NA"
+
+    # Authors of an article that ran over its time budget in classifyAuthors are left unclassified
+    authorsOverBudget = 'authors' in raw['overBudget']
+
+    authors = raw['authors']
+    for idx, (foreName, affiliation) in enumerate(authors):
+        if foreName:
+            authorForeNames.append(foreName)
+            if authorsOverBudget:
+                gender = country = overBudgetMarker
+            else:
+                gender = genders[foreName] if needs['gender'] else "NA"
+                country = countries[affiliation] if needs['country'] else "NA"
+            if idx == 0:
+                genderFirstAuthor = gender
+                countryFirstAuthor = country
+            if idx == len(authors) - 1:
+                genderLastAuthor = gender
+                countryLastAuthor = country
+            if "@" in (affiliation or ""):
+                genderLastCorrespondingAuthor = gender
+                countryLastCorrespondingAuthor = country
+
+            if gender == "F":
+                numberFemaleAuthors += 1
+            elif gender == "M":
+                numberMaleAuthors += 1
+            elif gender == "U":
+                numberUnisexAuthors += 1
             else:
                 numberUnknownAuthors += 1
-
-            authorAffiliations.append(affiliation if affiliation else '0')
-        
-        if numberFemaleAuthors + numberMaleAuthors > 0:
-            fractionFemaleAuthors = numberFemaleAuthors / (numberFemaleAuthors + numberMaleAuthors)
         else:
-            fractionFemaleAuthors = "NA"
-        
-        authorForeNameStr = ';'.join(authorForeNames)
-        authorAffiliationsStr = '¶'.join(authorAffiliations)
-        
-
-        pubType = article.findtext('MedlineCitation/Article/PublicationTypeList/PublicationType')           #Publication Type
-
-                                                                                                            #PubMed received and accepted dates
-        pubMedRecDate = article.find('PubmedData/History/PubMedPubDate[@PubStatus="received"]')
-        pubMedRec = None
-        if pubMedRecDate is not None:
-            pubMedRec = f"{pubMedRecDate.findtext('Year')}-{pubMedRecDate.findtext('Month')}-{pubMedRecDate.findtext('Day')}"
-        
-        pubMedAccDate = article.find('PubmedData/History/PubMedPubDate[@PubStatus="accepted"]')
-        pubMedAcc = None
-        if pubMedAccDate is not None:
-            pubMedAcc = f"{pubMedAccDate.findtext('Year')}-{pubMedAccDate.findtext('Month')}-{pubMedAccDate.findtext('Day')}"
-        
-        timeUnderReview = None
-        if pubMedRec and pubMedAcc:
-            try:
-                recDate = datetime.strptime(pubMedRec, '%Y-%m-%d')
-                accDate = datetime.strptime(pubMedAcc, '%Y-%m-%d')
-                timeUnderReview = (accDate - recDate).days
-            except ValueError as e:
-                timeUnderReview = "NA"
-
-
-        # Create list for the article data gathered
-        articleData = [
-            pmid, pubDateYear, journalTitle, journalIso, articleTitle,
-            pagination, numPages, abstract, authorForeNameStr,
-            authorAffiliationsStr, genderFirstAuthor, genderLastAuthor, genderLastCorrespondingAuthor,
-            countryFirstAuthor, countryLastAuthor, countryLastCorrespondingAuthor,
-            numberFemaleAuthors, numberMaleAuthors, numberUnisexAuthors, 
-            numberUnknownAuthors, fractionFemaleAuthors, pubType, pubMedRec, pubMedAcc, timeUnderReview,
-            daleChallScore, fleschScore, fleschKinCaidScore, gunningFogScore, smogScore,
-        ]
+            numberUnknownAuthors += 1
 
+        authorAffiliations.append(affiliation if affiliation else '0')
+    
+    if numberFemaleAuthors + numberMaleAuthors > 0:
+        fractionFemaleAuthors = numberFemaleAuthors / (numberFemaleAuthors + numberMaleAuthors)
+    else:
+        fractionFemaleAuthors = "NA"
+
+    if authorsOverBudget:
+        numberFemaleAuthors = numberMaleAuthors = numberUnisexAuthors = numberUnknownAuthors = "NA"
+    
+    authorForeNameStr = ';'.join(authorForeNames)
+    authorAffiliationsStr = '¶'.join(authorAffiliations)
+
+    pubMedRec = None
+    pubMedAcc = None
+    timeUnderReview = None
+    timeAcceptedToPubMed = None
+    numberOfRevisions = "NA"
+
+    if raw['history'] is not None:
+        rawDates, epochDays, revisions = raw['history']
+        if rawDates is not None:
+            pubMedRec = rawDates.get('received')
+            pubMedAcc = rawDates.get('accepted')
+            timeUnderReview = daysBetween(rawDates, epochDays, 'received', 'accepted')
+            timeAcceptedToPubMed = daysBetween(rawDates, epochDays, 'accepted', 'pubmed')
+            numberOfRevisions = revisions
+
+
+    # Optional columns, ';' separated with one value per abstract section
+    sectionLabels = sectionLengths = "NA"
+    if needs['sections'] and raw['abstractSections']:
+        sectionLabels = ';'.join(label or "NA" for label, text in raw['abstractSections'])
+        sectionLengths = ';'.join(str(len(text)) for label, text in raw['abstractSections'])
+
+    sectionScoreColumns = ["NA"] * 5
+    if sectionScores:
+        sectionScoreColumns = [';'.join(str(scores[i]) for scores in sectionScores) for i in range(5)]
+
+    # Create list for the article data gathered
+    return [
+        raw['pmid'], raw['pubDateYear'], raw['journalTitle'], raw['journalIso'], raw['articleTitle'],
+        pagination, numPages, abstract, authorForeNameStr,
+        authorAffiliationsStr, genderFirstAuthor, genderLastAuthor, genderLastCorrespondingAuthor,
+        countryFirstAuthor, countryLastAuthor, countryLastCorrespondingAuthor,
+        numberFemaleAuthors, numberMaleAuthors, numberUnisexAuthors, 
+        numberUnknownAuthors, fractionFemaleAuthors, raw['pubType'], pubMedRec, pubMedAcc, timeUnderReview,
+        daleChallScore, fleschScore, fleschKinCaidScore, gunningFogScore, smogScore,
+        timeAcceptedToPubMed, numberOfRevisions, sectionLabels, sectionLengths,
+    ] + sectionScoreColumns + [readabilityStatus] + [';'.join(raw['fields'].get(extractor.column, ["NA"]))
+                                                     for extractor in fieldExtractors]
+
+
+# Function used to enrich a batch of extracted articles and add their selected columns to the journal batches
+# Optional pipeline stages (see DuplicateIndex) get every batch of extracted articles through processBatch,
+# together with the author classifications of the batch
+def enrichBatch(rawArticles, columns, needs, journalsData, stats=None, stages=(), budget=None):
+    batchStart = time.perf_counter()
+
+    projectColumns = list(columns) != allColumns
+    columnIndexes = [allColumns.index(column) for column in columns]
+
+    genders, countries = classifyAuthors(rawArticles, needs, stats, budget)
+
+    for stage in stages:
+        stage.processBatch(rawArticles, genders, countries)
+
+    for raw in rawArticles:
+        articleData = enrichArticle(raw, needs, genders, countries, budget)
+
+        # Articles that ran over their time budget are quarantined, see writeProblematicAbstracts
+        if stats is not None and raw['overBudget']:
+            stats['overBudgetArticles'] += 1
+            for stageName in raw['overBudget']:
+                stats['overBudget' + stageName.capitalize()] += 1
+            stats.setdefault('quarantine', []).append([raw['pmid'], raw['abstract'], raw['journalIso']])
+
+        if stats is not None and (needs['readability'] or needs['sectionReadability']) and raw['abstract'] != "NA":
+            stats['abstracts'] += 1
+            if not raw['english']:
+                stats['nonEnglishAbstracts'] += 1
+
+        # Only keep the requested columns
+        if projectColumns:
+            articleData = [articleData[i] for i in columnIndexes]
+
+        journalIso = raw['journalIso']
         if journalIso not in journalsData:
-            journalsData[journalIso] = []
-        
+            journalsData[journalIso] = ArticleBatch(columns)
         journalsData[journalIso].append(articleData)
 
+    if stats is not None:
+        stats['processingTime'] += time.perf_counter() - batchStart
+
+
+# Counters and timings collected by parsePubMedArticles when it is given a stats dictionary
+statsKeys = ['articles', 'sampled', 'processingTime', 'authorNames', 'uniqueAuthorNames',
+             'affiliations', 'uniqueAffiliations', 'genderTime', 'countryTime', 'abstracts', 'nonEnglishAbstracts',
+             'overBudgetArticles', 'overBudgetAuthors', 'overBudgetReadability']
+
+
+# Function used to open the xml source of the streaming functions: a path to an .xml or .xml.gz file,
+# the xml as bytes, or an open file object (binary, gzip.open files included)
+def openXmlSource(source):
+    if isinstance(source, (bytes, bytearray)):
+        return io.BytesIO(source)
+    if isinstance(source, (str, os.PathLike)):
+        if os.fspath(source).endswith('.gz'):
+            return gzip.open(source, 'rb')
+        return open(source, 'rb')
+    return source
+
+
+# Function used to stream the PubmedArticle elements of an xml file, each element is freed once the caller is done with it
+def iterArticleElements(xmlFile):
+    root = None
+    for event, article in ET.iterparse(xmlFile, events=('start', 'end')):
+        if root is None:
+            root = article
+        elif event == 'end' and article.tag == 'PubmedArticle':
+            yield article
+            article.clear()
+            # Drop the finished children of the root too, the cleared elements would otherwise pile up in it
+            del root[:]
+
+
+# Function used to turn a list of column values into a record, with typed numbers and None for missing values
+def articleRecord(columns, articleData):
+    record = {}
+    for column, value in zip(columns, articleData):
+        if value == "NA":
+            value = None
+        elif value is not None and column in integerColumns:
+            value = int(value)
+        elif value is not None and column in floatColumns:
+            value = float(value)
+        record[column] = value
+    return record
+
+
+# Number of articles extracted before their authors are classified and their records are yielded by iterArticles
+streamBatchSize = 100
+
+
+# Function used to lazily yield the enriched records of the articles in source (see openXmlSource) for use as a library,
+# without buffering journals or writing .tsv files
+def iterArticles(source, columns=None, batchSize=streamBatchSize):
+    columns = selectColumns(columns)
+    needs = columnNeeds(columns)
+    columnIndexes = [allColumns.index(column) for column in columns]
+
+    xmlFile = openXmlSource(source)
+    try:
+        pendingArticles = []
+        elements = iterArticleElements(xmlFile)
+        while True:
+            for article in elements:
+                pendingArticles.append(extractArticle(article, needs))
+                if len(pendingArticles) >= batchSize:
+                    break
+            if not pendingArticles:
+                break
+
+            # Authors are still classified once per batch, see classifyAuthors
+            genders, countries = classifyAuthors(pendingArticles, needs)
+            for raw in pendingArticles:
+                articleData = enrichArticle(raw, needs, genders, countries)
+                yield articleRecord(columns, [articleData[i] for i in columnIndexes])
+            pendingArticles = []
+    finally:
+        if xmlFile is not source:
+            xmlFile.close()
+
+
+# Function used to enrich a single PubmedArticle element into a record, see iterArticles
+def enrichArticleElement(article, columns=None):
+    columns = selectColumns(columns)
+    needs = columnNeeds(columns)
+    raw = extractArticle(article, needs)
+    genders, countries = classifyAuthors([raw], needs)
+    articleData = enrichArticle(raw, needs, genders, countries)
+    return articleRecord(columns, [articleData[allColumns.index(column)] for column in columns])
+
+
+# Function used to parse the PubMedArticles
+def parsePubMedArticles(xmlFile, columns=None, batchSize=None, flushBatch=None, sampler=None, stats=None, stages=(),
+                        skipArticles=0, budget=None, maxArticles=None):
+    # Work out which columns were requested so the others can be skipped entirely
+    if columns is None:
+        columns = tsvHeader
+    needs = columnNeeds(columns)
+
+    # Stages can ask for raw fields that the selected columns do not need
+    for stage in stages:
+        for need in stage.needs:
+            # Stages asking for the extra fields get the values of every field extractor
+            needs[need] = fieldTree(fieldExtractors) if need == 'fields' else True
+    
+    journalsData = {}
+    pendingArticles = []
+    articleIndex = -1
+
+    if batchSize is None:
+        batchSize = defaultBatchSize
+    if stats is not None:
+        for key in statsKeys:
+            stats.setdefault(key, 0)
+
+
+    # Stream through the xml file with ElementTree, collecting the raw fields of every article
+    for article in iterArticleElements(xmlFile):
+        articleIndex += 1
+
+        # Stop reading the file once the first maxArticles articles are done
+        if maxArticles is not None and articleIndex >= maxArticles:
+            break
+
+        # Skip the articles already written out before a checkpoint
+        if articleIndex < skipArticles:
+            article.clear()
+            continue
+
+        # Skip the articles left out of the sample
+        if sampler is not None and not sampler(articleIndex, article.findtext('MedlineCitation/PMID')):
+            article.clear()
+            if stats is not None:
+                stats['articles'] += 1
+            continue
+        articleStart = time.perf_counter()
+
+        pendingArticles.append(extractArticle(article, needs))
+
+        if stats is not None:
+            stats['articles'] += 1
+            stats['sampled'] += 1
+            stats['processingTime'] += time.perf_counter() - articleStart
+
+        # Enrich full batches at once and hand them over to the writer instead of keeping the whole file in memory
+        if len(pendingArticles) >= batchSize:
+            enrichBatch(pendingArticles, columns, needs, journalsData, stats, stages, budget)
+            pendingArticles = []
+            if flushBatch is not None:
+                flushBatch(journalsData)
+                journalsData = {}
+
+    if pendingArticles:
+        enrichBatch(pendingArticles, columns, needs, journalsData, stats, stages, budget)
+
     return journalsData
 
 
@@ -416,66 +1250,1704 @@ def cleanFileName(name):
     cleanName = cleanName.rstrip(". ")
     return cleanName
 
+# File name extensions of the supported output compressions
+compressionExtensions = {'none': '', 'gzip': '.gz', 'zstd': '.zst'}
+
+
+# Function used to open a (compressed) .tsv file for reading as text, based on its extension
+def openTsv(fileName):
+    if fileName.endswith('.gz'):
+        # gzip reads every member of files that were appended to
+        return gzip.open(fileName, 'rt', newline='', encoding='utf-8')
+    if fileName.endswith('.zst'):
+        if zstandard is None:
+            raise ImportError("The zstandard package is needed to read " + fileName)
+        reader = zstandard.ZstdDecompressor().stream_reader(open(fileName, 'rb'), read_across_frames=True, closefd=True)
+        return io.TextIOWrapper(reader, newline='', encoding='utf-8')
+    return open(fileName, 'r', newline='', encoding='utf-8')
+
+
+# Function used to read the rows of a .tsv, .tsv.gz or .tsv.zst output file back, header row included
+def readTsv(fileName):
+    with openTsv(fileName) as tsvFile:
+        for row in csv.reader(tsvFile, delimiter='\t'):
+            yield row
+
+
+# Function used to check that an existing output file has the same columns as the rows about to be appended
+def checkTsvHeader(fileName, header):
+    existingHeader = next(readTsv(fileName), None)
+    if existingHeader is not None and existingHeader != list(header):
+        raise ValueError("Columns of " + fileName + " do not match the selected columns")
+
+
+# Types of the output columns when loaded back with loadOutput, "NA" and empty cells become missing values
+loaderTypes = {'PMID': 'Int64', 'PubDateYear': 'Int16'}
+loaderTypes.update({column: 'Int32' for column in integerColumns})
+loaderTypes.update({column: 'float32' for column in floatColumns})
+
+# Columns with few distinct values, loaded as categoricals
+categoryColumns = (['JournalTitle', 'JournalIso', 'PublicationType', 'ReadabilityStatus', 'GenderFirstAuthor',
+                    'GenderLastAuthor', 'GenderLastCorrespondingAuthor'] + columnGroups['country'])
+
+# Wide text columns, only loaded when asked for
+textColumns = (['ArticleTitle', 'Abstract', 'AuthorForeNames', 'AuthorAffiliations'] + columnGroups['sections'] +
+               columnGroups['sectionReadability'])
+
+
+# Function used to list the output files of a directory, or to pass file names through
+def outputFiles(source):
+    if isinstance(source, (list, tuple)):
+        return list(source)
+    if os.path.isdir(source):
+        return sorted(fileName for extension in compressionExtensions.values()
+                      for fileName in glob.glob(os.path.join(source, '*.tsv' + extension)))
+    return [source]
+
+
+# Function used to read one output file into pandas DataFrames of at most chunkSize rows, with the loader types
+def readOutputChunks(fileName, columns, includeText, chunkSize):
+    with openTsv(fileName) as tsvFile:
+        header = next(csv.reader([tsvFile.readline()], delimiter='\t'))
+        if columns is not None:
+            useColumns = [column for column in header if column in columns]
+        else:
+            useColumns = [column for column in header if includeText or column not in textColumns]
+        types = {column: loaderTypes.get(column, 'category' if column in categoryColumns else 'string')
+                 for column in useColumns}
+        reader = pandas.read_csv(tsvFile, sep='\t', names=header, header=None, usecols=useColumns, dtype=types,
+                                 na_values=['NA', ''], keep_default_na=False, chunksize=chunkSize or 100000)
+        for chunk in reader:
+            yield chunk
+
+
+# Function used to combine DataFrames, keeping the categorical columns categorical
+def concatFrames(frames):
+    if len(frames) == 1:
+        return frames[0]
+    for column in categoryColumns:
+        if all(column in frame for frame in frames):
+            categories = pandas.api.types.union_categoricals([frame[column] for frame in frames]).categories
+            for frame in frames:
+                frame[column] = frame[column].cat.set_categories(categories)
+    return pandas.concat(frames, ignore_index=True)
+
+
+# Function used to load the .tsv, .tsv.gz or .tsv.zst output files of a directory (or a file or list of files)
+# into a pandas DataFrame with compact types. The wide text columns are skipped unless includeText is set or
+# columns are selected (same names and groups as --columns). With chunkSize, DataFrames of at most chunkSize
+# rows are yielded instead, so the output can be processed without loading all of it.
+def loadOutput(source='./tsvFiles', columns=None, includeText=False, chunkSize=None):
+    if pandas is None:
+        raise ImportError("The pandas package is needed to load the output")
+    if columns is not None:
+        columns = selectColumns(columns)
+
+    chunks = (chunk for fileName in outputFiles(source)
+              for chunk in readOutputChunks(fileName, columns, includeText, chunkSize))
+    if chunkSize is not None:
+        return chunks
+
+    frames = list(chunks)
+    if not frames:
+        return pandas.DataFrame(columns=columns or [])
+    return concatFrames(frames)
+
+
 # Function used to write data out to a .tsv file
-def writeToTsv(fileName, data):
-    tsvHeader = ['PMID', 'PubDateYear', 'JournalTitle', 'JournalIso', 
-                  'ArticleTitle', 'Pagination', 'NumPages', 'Abstract', 'AuthorForeNames', 
-                  'AuthorAffiliations', 'GenderFirstAuthor', 'GenderLastAuthor', 'GenderLastCorrespondingAuthor', 
-                  'CountryFirstAuthor', 'CountryLastAuthor', 'CountryLastCorrespondingAuthor', 
-                  'NumberFemaleAuthors', 'NumberMaleAuthors', 'NumberUnisexAuthor', 
-                  'NumberUnknownAuthors', 'FractionFemaleAuthors', 'PublicationType', 
-                  'PubMedPubDate(received)', 'PubMedPubDate(accepted)', 'TimeUnderReview(days)', 
-                  'DaleChallScore', 'FleschScore', 'FleschKinCaidScore', 'GunningFogScore', 'SmogScore']
-    
+def writeToTsv(fileName, data, header=None):
+    if header is None:
+        header = tsvHeader
+
     file_exists = os.path.isfile(fileName)
 
+    # Refuse to append rows with a different set of columns to an existing file
+    if file_exists:
+        checkTsvHeader(fileName, header)
+
     # Open tsv file in append mode if it exists, otherwise write mode
     with open(fileName, 'a' if file_exists else 'w', newline='', encoding='utf-8') as tsvFile:
         tsvWriter = csv.writer(tsvFile, delimiter='\t')
         if not file_exists:
-            tsvWriter.writerow(tsvHeader)  # Write header if file does not exist
+            tsvWriter.writerow(header)  # Write header if file does not exist
         tsvWriter.writerows(data)  # Write rows
 
 
+# Writer for compressed .tsv files. Batches are formatted and compressed on a thread pool while a single
+# writer thread appends the results in submission order. Each batch becomes its own gzip member or zstd
+# frame, so files appended to across input files are still valid concatenated streams.
+class CompressedTsvWriter:
+
+    def __init__(self, compression='gzip', level=None, threads=4):
+        if compression not in ('gzip', 'zstd'):
+            raise ValueError("Unsupported compression: " + str(compression))
+        if compression == 'zstd' and zstandard is None:
+            raise ImportError("The zstandard package is needed for zstd compression")
+
+        self.compression = compression
+        self.extension = compressionExtensions[compression]
+        if level is None:
+            level = 6 if compression == 'gzip' else 3
+        self.level = level
+        self.pool = ThreadPoolExecutor(max_workers=threads)
+        self.pending = queue.Queue(maxsize=threads * 4)
+        self.knownFiles = set()
+        self.error = None
+        self.writerThread = threading.Thread(target=self.writeCompressed, daemon=True)
+        self.writerThread.start()
+
+    # Queue rows to be compressed and appended to fileName (the compression extension is added by the caller)
+    def write(self, fileName, data, header=None):
+        if self.error is not None:
+            raise self.error
+        if header is None:
+            header = tsvHeader
+
+        # Only the first batch of a new file gets the header row
+        writeHeader = False
+        if fileName not in self.knownFiles:
+            if os.path.isfile(fileName):
+                checkTsvHeader(fileName, header)
+            else:
+                writeHeader = True
+            self.knownFiles.add(fileName)
+
+        future = self.pool.submit(self.compressRows, data, list(header) if writeHeader else None)
+        self.pending.put((fileName, future))
+
+    # Queue a stream of rows in chunks of at most chunkSize rows, so a large journal or shard is never held in
+    # memory whole. The queue is bounded, so reading the stream waits for the compression to catch up.
+    def writeChunks(self, fileName, rows, header=None, chunkSize=defaultBatchSize):
+        rows = iter(rows)
+        chunk = list(itertools.islice(rows, chunkSize))
+        while True:
+            self.write(fileName, chunk, header)
+            chunk = list(itertools.islice(rows, chunkSize))
+            if not chunk:
+                break
+
+    # Format rows as tsv text and compress them into one self-contained gzip member or zstd frame
+    def compressRows(self, data, header):
+        text = io.StringIO()
+        tsvWriter = csv.writer(text, delimiter='\t')
+        if header is not None:
+            tsvWriter.writerow(header)
+        tsvWriter.writerows(data)
+        raw = text.getvalue().encode('utf-8')
+
+        if self.compression == 'gzip':
+            return gzip.compress(raw, compresslevel=self.level)
+        return zstandard.ZstdCompressor(level=self.level).compress(raw)
+
+    # Writer thread: append the compressed batches to their files in the order they were submitted
+    def writeCompressed(self):
+        while True:
+            item = self.pending.get()
+            if item is None:
+                self.pending.task_done()
+                break
+            fileName, future = item
+            if self.error is None:
+                try:
+                    compressed = future.result()
+                    with open(fileName, 'ab') as outFile:
+                        outFile.write(compressed)
+                except Exception as e:
+                    self.error = e
+            self.pending.task_done()
+
+    # Wait until every batch queued so far has been written out, e.g. before taking a checkpoint
+    def flush(self):
+        self.pending.join()
+        if self.error is not None:
+            raise self.error
+
+    # Forget what is known about files that were removed or truncated behind the writer's back (see
+    # restoreCheckpoint), so a file that is written again gets its header row back
+    def forget(self, fileNames):
+        fileNames = {os.path.normpath(fileName) for fileName in fileNames}
+        self.knownFiles = {fileName for fileName in self.knownFiles if os.path.normpath(fileName) not in fileNames}
+
+    # Wait for every queued batch to be written out
+    def close(self):
+        self.pending.put(None)
+        self.writerThread.join()
+        self.pool.shutdown()
+        if self.error is not None:
+            raise self.error
+
+
+# Function used to write every journal's batch of articles out to its own .tsv file
+def writeJournalsData(journalsData, columns=None, writer=None, outputDir='./tsvFiles'):
+    for journalIso, articles in journalsData.items():
+        cleanName = cleanFileName(journalIso)
+        tsvFile= f'{outputDir}/{cleanName}.tsv'
+        if writer is not None:
+            writer.write(tsvFile + writer.extension, articles.rows(), columns)
+        else:
+            writeToTsv(tsvFile, articles.rows(), columns)
+
+
+# Groups batches of articles by journal within a memory budget. When the buffered batches grow past the
+# budget they are spilled to a temporary run file sorted by journal, and groups() merges the runs and what
+# is still in memory back together like an external sort, yielding every journal's rows in one piece.
+class JournalSpiller:
+
+    def __init__(self, memoryBudget, spillDir=None):
+        self.memoryBudget = memoryBudget
+        self.spillDir = spillDir
+        self.journals = {}
+        self.bufferedBytes = 0
+        self.runFiles = []
+        self.runDir = None
+
+    # Add a dictionary of journal batches, as handed over by parsePubMedArticles
+    def add(self, journalsData):
+        for journalIso, articles in journalsData.items():
+            self.journals.setdefault(journalIso, []).append(articles)
+            self.bufferedBytes += articles.approximateSize()
+
+        if self.bufferedBytes > self.memoryBudget:
+            self.spill()
+
+    # Write everything buffered to a new run file, sorted by journal with the journal in the first column
+    def spill(self):
+        if not self.journals:
+            return
+        if self.runDir is None:
+            self.runDir = tempfile.mkdtemp(prefix='journalRuns', dir=self.spillDir)
+
+        runFile = os.path.join(self.runDir, f'run{len(self.runFiles)}.tsv')
+        with open(runFile, 'w', newline='', encoding='utf-8') as tsvFile:
+            tsvWriter = csv.writer(tsvFile, delimiter='\t')
+            for key, row in self.bufferedRows():
+                tsvWriter.writerow([key] + row)
+        self.runFiles.append(runFile)
+
+        self.journals = {}
+        self.bufferedBytes = 0
+
+    # Rows still in memory, sorted by journal, as (journal key, row) pairs
+    def bufferedRows(self):
+        for journalIso in sorted(self.journals, key=lambda journal: journal or ''):
+            for articles in self.journals[journalIso]:
+                for row in articles.rows():
+                    yield journalIso or '', row
+
+    # Rows of a run file as (journal key, row) pairs
+    def runRows(self, runFile):
+        with open(runFile, 'r', newline='', encoding='utf-8') as tsvFile:
+            for row in csv.reader(tsvFile, delimiter='\t'):
+                yield row[0], row[1:]
+
+    # Yield (journalIso, rows) for every journal, merging the run files with the rows still in memory.
+    # The merge is stable, so every journal's rows keep the order in which they were added.
+    def groups(self):
+        try:
+            sources = [self.runRows(runFile) for runFile in self.runFiles] + [self.bufferedRows()]
+            merged = heapq.merge(*sources, key=lambda item: item[0])
+            for key, group in itertools.groupby(merged, key=lambda item: item[0]):
+                yield (key or None), (row for _, row in group)
+        finally:
+            self.close()
+
+    # Remove the run files and forget the buffered batches
+    def close(self):
+        for runFile in self.runFiles:
+            os.remove(runFile)
+        if self.runDir is not None:
+            os.rmdir(self.runDir)
+        self.runFiles = []
+        self.runDir = None
+        self.journals = {}
+        self.bufferedBytes = 0
+
+
+# Function used to write the merged journal groups of a JournalSpiller out, one .tsv file per journal
+def writeJournalGroups(spiller, columns=None, writer=None, outputDir='./tsvFiles', chunkSize=defaultBatchSize):
+    for journalIso, rows in spiller.groups():
+        cleanName = cleanFileName(journalIso)
+        tsvFile= f'{outputDir}/{cleanName}.tsv'
+        if writer is not None:
+            # The compression threads read the rows later, so every chunk is taken out of the merge first
+            writer.writeChunks(tsvFile + writer.extension, rows, columns, chunkSize)
+        else:
+            writeToTsv(tsvFile, rows, columns)
+
+
 # Function to write problematic abstracts to a TSV file
 def writeProblematicAbstracts(fileName, data):
     tsvHeader = ['PMID', 'Abstract', 'JournalISO']
-    # Open tsv file 
-    with open(fileName, 'w', newline='', encoding='utf-8') as tsvFile:
+    file_exists = os.path.isfile(fileName)
+    # Open tsv file in append mode if it exists, the articles of every input file end up in the same file
+    with open(fileName, 'a' if file_exists else 'w', newline='', encoding='utf-8') as tsvFile:
         tsvWriter = csv.writer(tsvFile, delimiter='\t')
-        tsvWriter.writerow(tsvHeader)  # Write header
+        if not file_exists:
+            tsvWriter.writerow(tsvHeader)  # Write header
         tsvWriter.writerows(data)  # Write rows
 
-def main():
+# Function used to report the articles of an input file that ran over their time budget
+def printBudgetReport(stats, xmlFile):
+    if stats['overBudgetArticles']:
+        print(f"{stats['overBudgetArticles']} articles of {xmlFile} ran over their time budget "
+              f"(author classification: {stats['overBudgetAuthors']}, readability: {stats['overBudgetReadability']})")
+
+# Function used to print how much work the per-batch deduplication of author names and affiliations saved
+def printDedupReport(stats):
+    enrichTime = stats['genderTime'] + stats['countryTime']
+    if enrichTime <= 0:
+        return
+
+    # Without deduplication every occurrence would have been classified
+    estimatedTime = 0.0
+    if stats['uniqueAuthorNames']:
+        estimatedTime += stats['genderTime'] * stats['authorNames'] / stats['uniqueAuthorNames']
+    if stats['uniqueAffiliations']:
+        estimatedTime += stats['countryTime'] * stats['affiliations'] / stats['uniqueAffiliations']
+
+    print(f"Classified {stats['uniqueAuthorNames']} unique of {stats['authorNames']} author names and "
+          f"{stats['uniqueAffiliations']} unique of {stats['affiliations']} affiliations in {enrichTime:.2f}s, "
+          f"estimated speedup from deduplication: {estimatedTime / enrichTime:.1f}x")
+
+
+# Function used to report how many abstracts were not scored for readability because they are not in English
+def printLanguageReport(stats):
+    if stats['abstracts']:
+        print(f"Skipped readability of {stats['nonEnglishAbstracts']} non-English of {stats['abstracts']} abstracts "
+              f"({100 * stats['nonEnglishAbstracts'] / stats['abstracts']:.1f}%)")
+
+
+# Prime modulus of the MinHash permutations, below 2**32 so the products fit in 64 bits
+minhashPrime = 4294967291
+
+
+# Function used to hash the word shingles of an abstract to 32 bit integers
+def shingleHashes(text, shingleSize=3):
+    words = re.findall(r'\w+', text.lower())
+    if len(words) <= shingleSize:
+        shingles = {' '.join(words)} if words else set()
+    else:
+        shingles = {' '.join(words[i:i + shingleSize]) for i in range(len(words) - shingleSize + 1)}
+    return [zlib.crc32(shingle.encode('utf-8')) for shingle in shingles]
+
+
+# Persistent MinHash/LSH index of the abstracts, used as a pipeline stage to find near-duplicate articles.
+# Signatures and band buckets are kept in an sqlite file, so the index can be updated with every new
+# baseline or update file. Every article is only compared with the articles sharing one of its buckets,
+# and the candidate pairs with an estimated Jaccard similarity of at least threshold are appended to
+# pairsFile as they are found.
+class DuplicateIndex:
+    needs = ['abstract']
+    pairsHeader = ['PMID1', 'PMID2', 'EstimatedJaccard']
+
+    def __init__(self, indexFile, pairsFile, numPerm=128, bands=32, threshold=0.5, shingleSize=3, maxCandidates=100):
+        if numPerm % bands != 0:
+            raise ValueError("The number of permutations must be a multiple of the number of bands")
+
+        self.pairsFile = pairsFile
+        self.threshold = threshold
+        self.shingleSize = shingleSize
+        self.maxCandidates = maxCandidates
+        self.numberOfPairs = 0
+
+        self.db = sqlite3.connect(indexFile)
+        self.db.execute("CREATE TABLE IF NOT EXISTS settings (name TEXT PRIMARY KEY, value INTEGER)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS signatures (pmid TEXT PRIMARY KEY, signature BLOB)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS buckets (band INTEGER, key INTEGER, pmid TEXT)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS bucketKeys ON buckets (band, key)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS bucketPmids ON buckets (pmid)")
+
+        # An existing index keeps the settings it was built with
+        settings = dict(self.db.execute("SELECT name, value FROM settings"))
+        if settings:
+            if settings['numPerm'] != numPerm or settings['bands'] != bands or settings['shingleSize'] != shingleSize:
+                raise ValueError("The duplicate index " + indexFile + " was built with different settings")
+        else:
+            self.db.executemany("INSERT INTO settings VALUES (?, ?)",
+                                [('numPerm', numPerm), ('bands', bands), ('shingleSize', shingleSize)])
+            self.db.commit()
+
+        self.numPerm = numPerm
+        self.bands = bands
+        self.rows = numPerm // bands
+
+        # Fixed seed, so the permutations are the same on every run
+        rng = random.Random(1)
+        self.coefficients = [(rng.randrange(1, minhashPrime), rng.randrange(0, minhashPrime)) for _ in range(numPerm)]
+        if numpy is not None:
+            self.a = numpy.array([a for a, b in self.coefficients], dtype=numpy.uint64)[:, None]
+            self.b = numpy.array([b for a, b in self.coefficients], dtype=numpy.uint64)[:, None]
+
+    # Function used to compute the MinHash signature of a text, None when it has no words
+    def signature(self, text):
+        hashes = shingleHashes(text, self.shingleSize)
+        if not hashes:
+            return None
+        if numpy is not None:
+            values = numpy.array(hashes, dtype=numpy.uint64)[None, :]
+            return array('I', ((self.a * values + self.b) % minhashPrime).min(axis=1).astype(numpy.uint32).tobytes())
+        return array('I', [min((a * value + b) % minhashPrime for value in hashes) for a, b in self.coefficients])
+
+    # Stage entry point: add the abstracts of a batch to the index and write out the near-duplicate pairs found
+    def processBatch(self, rawArticles, genders, countries):
+        pairs = []
+        for raw in rawArticles:
+            if raw['abstract'] != "NA" and raw['pmid']:
+                signature = self.signature(raw['abstract'])
+                if signature is not None:
+                    pairs.extend(self.insert(raw['pmid'], signature))
+        self.db.commit()
+
+        if pairs:
+            writeToTsv(self.pairsFile, pairs, self.pairsHeader)
+            self.numberOfPairs += len(pairs)
+
+    # Function used to add one signature to the index, returns its near-duplicate pairs with articles already indexed
+    def insert(self, pmid, signature):
+        # A record that comes back in an update file replaces its old signature, unless its abstract is unchanged
+        existing = self.db.execute("SELECT signature FROM signatures WHERE pmid = ?", (pmid,)).fetchone()
+        if existing is not None:
+            if existing[0] == signature.tobytes():
+                return []
+            self.db.execute("DELETE FROM buckets WHERE pmid = ?", (pmid,))
+
+        bandKeys = []
+        candidates = set()
+        for band in range(self.bands):
+            key = zlib.crc32(signature[band * self.rows:(band + 1) * self.rows].tobytes())
+            bandKeys.append((band, key, pmid))
+            for (candidate,) in self.db.execute("SELECT pmid FROM buckets WHERE band = ? AND key = ? LIMIT ?",
+                                                (band, key, self.maxCandidates)):
+                candidates.add(candidate)
+
+        pairs = []
+        for candidate in candidates:
+            row = self.db.execute("SELECT signature FROM signatures WHERE pmid = ?", (candidate,)).fetchone()
+            other = array('I')
+            other.frombytes(row[0])
+            similarity = sum(1 for x, y in zip(signature, other) if x == y) / self.numPerm
+            if similarity >= self.threshold:
+                pairs.append([candidate, pmid, round(similarity, 4)])
+
+        self.db.execute("INSERT OR REPLACE INTO signatures VALUES (?, ?)", (pmid, signature.tobytes()))
+        self.db.executemany("INSERT INTO buckets VALUES (?, ?, ?)", bandKeys)
+        return pairs
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+
+# Function used to write a sparse matrix of counts as (coordinates..., count) rows, gzip compressed for .gz names
+def writeSparseCounts(fileName, header, counts):
+    opener = gzip.open if fileName.endswith('.gz') else open
+    with opener(fileName, 'wt', newline='', encoding='utf-8') as tsvFile:
+        tsvWriter = csv.writer(tsvFile, delimiter='\t')
+        tsvWriter.writerow(header)
+        for key in sorted(counts, key=lambda key: tuple(str(part) for part in key)):
+            tsvWriter.writerow(list(key) + [counts[key]])
+
+
+# Function used to read a sparse matrix of counts written by writeSparseCounts back into a dictionary
+def readSparseCounts(fileName):
+    counts = {}
+    rows = readTsv(fileName)
+    next(rows, None)  # Skip the header row
+    for row in rows:
+        key = tuple(row[:-1])
+        counts[key] = counts.get(key, 0) + int(row[-1])
+    return counts
+
+
+# Pipeline stage accumulating sparse collaboration counts while the files are streamed:
+# the number of articles with authors from both countries of every pair of countries (the diagonal counts
+# the articles of every country), and the number of articles by first-author gender and last-author gender
+# for every journal and year. Accumulators of different workers can be combined with merge.
+class CollaborationMatrices:
+    needs = ['authors', 'gender', 'country']
+    countryHeader = ['Country1', 'Country2', 'Articles']
+    genderHeader = ['JournalIso', 'PubDateYear', 'GenderFirstAuthor', 'GenderLastAuthor', 'Articles']
+
+    def __init__(self):
+        self.countryPairs = {}
+        self.genderPairs = {}
+
+    # Stage entry point: add the articles of a batch to the counts
+    def processBatch(self, rawArticles, genders, countries):
+        for raw in rawArticles:
+            authors = raw['authors']
+            if not authors:
+                continue
+
+            # Resolve the country of every author, also those without a forename
+            articleCountries = set()
+            for foreName, affiliation in authors:
+                country = countries.get(affiliation)
+                if country is None:
+                    country = countries[affiliation] = findCountry(affiliation)
+                if country != "NA":
+                    articleCountries.add(country)
+
+            articleCountries = sorted(articleCountries)
+            for i, country in enumerate(articleCountries):
+                for otherCountry in articleCountries[i:]:
+                    key = (country, otherCountry)
+                    self.countryPairs[key] = self.countryPairs.get(key, 0) + 1
+
+            firstName = authors[0][0]
+            lastName = authors[-1][0]
+            genderFirstAuthor = (genders.get(firstName) or determineGender(firstName)) if firstName else "NA"
+            genderLastAuthor = (genders.get(lastName) or determineGender(lastName)) if lastName else "NA"
+            key = (raw['journalIso'], raw['pubDateYear'], genderFirstAuthor, genderLastAuthor)
+            self.genderPairs[key] = self.genderPairs.get(key, 0) + 1
+
+    # Add the counts of another accumulator, e.g. from another worker
+    def merge(self, other):
+        for key, count in other.countryPairs.items():
+            self.countryPairs[key] = self.countryPairs.get(key, 0) + count
+        for key, count in other.genderPairs.items():
+            self.genderPairs[key] = self.genderPairs.get(key, 0) + count
+
+    # Every file is written to a temporary name and moved in place, so readers never see half of it
+    def write(self, outputDir):
+        os.makedirs(outputDir, exist_ok=True)
+        for fileName, header, counts in [('countryCollaboration.tsv.gz', self.countryHeader, self.countryPairs),
+                                         ('genderCoauthorship.tsv.gz', self.genderHeader, self.genderPairs)]:
+            tempFile = os.path.join(outputDir, f".{os.getpid()}-{fileName}")
+            writeSparseCounts(tempFile, header, counts)
+            os.replace(tempFile, os.path.join(outputDir, fileName))
+
+    # Read the counts written to outputDir by write back, e.g. to merge the outputs of several workers
+    @classmethod
+    def load(cls, outputDir):
+        matrices = cls()
+        matrices.countryPairs = readSparseCounts(os.path.join(outputDir, 'countryCollaboration.tsv.gz'))
+        matrices.genderPairs = readSparseCounts(os.path.join(outputDir, 'genderCoauthorship.tsv.gz'))
+        return matrices
+
+
+# Default number of articles written out between two checkpoints inside a file
+defaultCheckpointInterval = 20000
+
+
+# Function used to get the current size of every output file, so they can be truncated back to it
+def outputSizes(outputDir):
+    sizes = {}
+    for entry in os.scandir(outputDir):
+        if entry.is_file():
+            sizes[entry.path] = entry.stat().st_size
+    return sizes
+
+
+# Function used to save the checkpoint of an input file: the number of its articles fully written out and the
+# sizes of the output files at that point. The file is replaced atomically so a crash never leaves half of it.
+# partials names the files holding what the optional accumulators had collected from the file at that point
+# (see savePartials), the partials of the previous checkpoint are removed once they are superseded.
+def saveCheckpoint(checkpointFile, inputFile, articles, offsets, complete=False, outputDir='./tsvFiles',
+                   partials=None):
+    previous = loadCheckpoint(checkpointFile)
+    checkpoint = {'inputFile': inputFile, 'articles': articles, 'offsets': offsets, 'complete': complete,
+                  'outputDir': outputDir, 'partials': partials or {}}
+    with open(checkpointFile + '.tmp', 'w', encoding='utf-8') as jsonFile:
+        json.dump(checkpoint, jsonFile)
+    os.replace(checkpointFile + '.tmp', checkpointFile)
+
+    if previous is not None:
+        for path in previous.get('partials', {}).values():
+            if path not in checkpoint['partials'].values():
+                removePartial(path)
+
+
+# Function used to remove a partial written by savePartials, a directory for the collaboration matrices
+def removePartial(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+# Function used to save the collaboration counts and quarantined articles of an input file, as they stand after
+# its first articles, next to its checkpoint. Each checkpoint gets its own partials, so a crash while they
+# are written leaves the ones of the previous checkpoint intact.
+def savePartials(checkpointFile, articles, collaboration=None, quarantine=None):
+    partials = {}
+    base = checkpointFile[:-len('.json')]
+    if collaboration is not None:
+        partials['collaboration'] = f"{base}.collaboration.{articles}"
+        collaboration.write(partials['collaboration'])
+    if quarantine:
+        partials['quarantine'] = f"{base}.quarantine.{articles}.tsv"
+        removePartial(partials['quarantine'])
+        writeProblematicAbstracts(partials['quarantine'], quarantine)
+    return partials
+
+
+# Function used to combine the partials of the complete checkpoints of the input files, so the collaboration
+# counts and the quarantine cover every file, including those processed by an earlier run or another worker
+def mergePartials(inputFiles, checkpointDir):
+    collaboration = CollaborationMatrices()
+    quarantine = []
+    for inputFile in inputFiles:
+        checkpoint = loadCheckpoint(os.path.join(checkpointDir, os.path.basename(inputFile) + '.json'))
+        if checkpoint is None or not checkpoint['complete']:
+            continue
+        partials = checkpoint.get('partials', {})
+        if 'collaboration' in partials:
+            collaboration.merge(CollaborationMatrices.load(partials['collaboration']))
+        if 'quarantine' in partials:
+            quarantine.extend(itertools.islice(readTsv(partials['quarantine']), 1, None))
+    return collaboration, quarantine
+
+
+# Function used to load the checkpoint of an input file, returns None if there is none
+def loadCheckpoint(checkpointFile):
+    if not os.path.isfile(checkpointFile):
+        return None
+    with open(checkpointFile, 'r', encoding='utf-8') as jsonFile:
+        return json.load(jsonFile)
+
+
+# Function used to undo the writes made after a checkpoint: output files are truncated back to their
+# checkpointed size and files created after the checkpoint are removed. The checkpoint can come from
+# another worker, so its own output directory is restored. Returns the files that were changed.
+def restoreCheckpoint(checkpoint):
+    offsets = checkpoint['offsets']
+    restored = []
+    for fileName, size in outputSizes(checkpoint['outputDir']).items():
+        if fileName not in offsets:
+            os.remove(fileName)
+            restored.append(fileName)
+        elif size > offsets[fileName]:
+            with open(fileName, 'r+b') as outFile:
+                outFile.truncate(offsets[fileName])
+            restored.append(fileName)
+    return restored
+
+
+# Default number of seconds a lease on an input file stays valid without a heartbeat
+defaultLeaseTime = 300
+
+
+# Lease on an input file in a directory shared by several workers, which is how the workers split the files
+# between them without a coordinator. A lease file holds the worker, a generation and the lease time of the
+# worker, and expires that many seconds after its modification time. It is only ever put in place whole, with link() for a new lease and
+# os.replace for a reclaimed one. A heartbeat thread keeps touching the worker's own lease file (through its
+# file descriptor, so it never touches a lease that replaced it) and sets lost once the lease was reclaimed.
+class FileLease:
+
+    def __init__(self, queueDir, inputFile, workerId, leaseTime=defaultLeaseTime):
+        self.leaseFile = os.path.join(queueDir, os.path.basename(inputFile) + '.lease')
+        self.workerId = workerId
+        self.leaseTime = leaseTime
+        self.stopped = threading.Event()
+        self.lost = threading.Event()
+        self.heartbeatThread = None
+        self.fd = None
+
+    # Write a complete lease of the given generation to a temporary file, returns its name
+    def writeLease(self, generation):
+        tempFile = f"{self.leaseFile}.{self.workerId}.{generation}.tmp"
+        with open(tempFile, 'w', encoding='utf-8') as leaseFile:
+            json.dump({'worker': self.workerId, 'generation': generation, 'leaseTime': self.leaseTime}, leaseFile)
+        return tempFile
+
+    # Read the current lease and the stat of its file, None if there is none
+    def readLease(self):
+        try:
+            with open(self.leaseFile, 'r', encoding='utf-8') as leaseFile:
+                return json.load(leaseFile), os.fstat(leaseFile.fileno())
+        except FileNotFoundError:
+            return None
+
+    # Try to take the lease, returns False if a live worker holds it or another worker reclaims it first
+    def acquire(self):
+        tempFile = self.writeLease(0)
+        try:
+            os.link(tempFile, self.leaseFile)
+            return self.start(tempFile)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(tempFile)
+
+        current = self.readLease()
+        if current is None or current[1].st_mtime + current[0]['leaseTime'] >= time.time():
+            return False
+
+        # The lease belongs to a dead worker. Of the workers that saw this generation expire, only the one
+        # creating its reclaim marker goes on, and only if the lease is still the expired one it saw.
+        lease, stat = current
+        marker = f"{self.leaseFile}.reclaim.{lease['generation']}"
+        try:
+            fd = os.open(marker, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        os.close(fd)
+        try:
+            again = self.readLease()
+            if again is None or again[0] != lease or (again[1].st_ino, again[1].st_mtime) != (stat.st_ino, stat.st_mtime):
+                return False
+            tempFile = self.writeLease(lease['generation'] + 1)
+            try:
+                os.replace(tempFile, self.leaseFile)
+            except BaseException:
+                os.remove(tempFile)
+                raise
+            return self.start(self.leaseFile)
+        finally:
+            # A worker winning this marker later finds a newer generation and gives up
+            os.remove(marker)
+
+    # Keep the lease file open, so the heartbeat touches this lease and held can tell if it was replaced
+    def start(self, leaseFile):
+        self.fd = os.open(leaseFile, os.O_RDONLY)
+        self.heartbeatThread = threading.Thread(target=self.heartbeat, daemon=True)
+        self.heartbeatThread.start()
+        return True
+
+    # Is the lease file still the one this worker created
+    def held(self):
+        if self.fd is None or self.lost.is_set():
+            return False
+        try:
+            return os.stat(self.leaseFile).st_ino == os.fstat(self.fd).st_ino
+        except FileNotFoundError:
+            return False
+
+    # Heartbeat thread: renew the lease until it is released, stop once another worker took it over
+    def heartbeat(self):
+        while not self.stopped.wait(self.leaseTime / 3):
+            if not self.held():
+                print("Lost the lease " + self.leaseFile)
+                self.lost.set()
+                return
+            os.utime(self.fd)
+
+    def release(self):
+        self.stopped.set()
+        if self.heartbeatThread is not None:
+            self.heartbeatThread.join()
+        if self.held():
+            os.remove(self.leaseFile)
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+# Raised when the lease on the input file being processed was reclaimed by another worker
+class LeaseLost(Exception):
+    pass
+
+
+# Function used to stop working on an input file whose lease was lost, see FileLease
+def checkLease(lease):
+    if lease is not None and not lease.held():
+        raise LeaseLost(lease.leaseFile)
+
+
+# Function used to hand out the input files to process, with their lease. Without a queue directory that is every
+# file (and no lease), with one the files are claimed one at a time through a FileLease, until every file has a
+# complete checkpoint.
+def claimInputFiles(inputFiles, queueDir=None, checkpointDir=None, workerId=None, leaseTime=defaultLeaseTime):
+    if queueDir is None:
+        for inputFile in inputFiles:
+            yield inputFile, None
+        return
+
+    while True:
+        remaining = []
+        for inputFile in inputFiles:
+            checkpoint = loadCheckpoint(os.path.join(checkpointDir, os.path.basename(inputFile) + '.json'))
+            if checkpoint is None or not checkpoint['complete']:
+                remaining.append(inputFile)
+        if not remaining:
+            return
+
+        claimed = False
+        for inputFile in remaining:
+            lease = FileLease(queueDir, inputFile, workerId, leaseTime)
+            if lease.acquire():
+                claimed = True
+                try:
+                    yield inputFile, lease
+                finally:
+                    lease.release()
+
+        # Every remaining file is leased by another worker, wait for them to finish or for a lease to expire
+        if not claimed:
+            time.sleep(min(leaseTime / 3, 10))
+
+
+# Function used to merge the per-worker output shards into the output directory, one file per journal.
+# Compressed shards are merged into files with the same compression.
+# Merging appends, so it refuses to run when a merged file already exists instead of doubling its rows.
+def mergeShards(shardRoot, outputDir='./tsvFiles', compressionLevel=None, compressionThreads=4):
+    for shard in os.listdir(shardRoot):
+        for fileName in os.listdir(os.path.join(shardRoot, shard)):
+            if os.path.exists(os.path.join(outputDir, fileName)):
+                raise ValueError(os.path.join(outputDir, fileName) + " already exists, the shards were already "
+                                 "merged or the output directory is not empty")
+
+    writers = {}
+    for shard in sorted(os.listdir(shardRoot)):
+        shardDir = os.path.join(shardRoot, shard)
+        for fileName in sorted(os.listdir(shardDir)):
+            rows = readTsv(os.path.join(shardDir, fileName))
+            header = next(rows, None)
+            if header is None:
+                continue
+            outputFile = os.path.join(outputDir, fileName)
+
+            compression = 'gzip' if fileName.endswith('.gz') else 'zstd' if fileName.endswith('.zst') else 'none'
+            if compression == 'none':
+                writeToTsv(outputFile, rows, header)
+                continue
+            if compression not in writers:
+                writers[compression] = CompressedTsvWriter(compression, compressionLevel, compressionThreads)
+            writers[compression].writeChunks(outputFile, rows, header)
+
+    for writer in writers.values():
+        writer.close()
+
+
+# Function used to build the article filter for the sampling mode, returns None when every article is wanted
+def makeSampler(sampleFraction=None, sampleFirst=None, seed=0):
+    if sampleFraction is None and sampleFirst is None:
+        return None
+
+    # The fraction is taken by hashing the PMID with the seed, so the same articles are picked on every run
+    threshold = int(sampleFraction * 2**32) if sampleFraction is not None else None
+
+    def keepArticle(index, pmid):
+        if sampleFirst is not None and index >= sampleFirst:
+            return False
+        if threshold is not None:
+            return zlib.crc32(f"{seed}:{pmid}".encode('utf-8')) < threshold
+        return True
+
+    return keepArticle
+
+
+# Categorical columns whose shares are reported by the sampling mode
+summaryCategoryColumns = ['GenderFirstAuthor', 'GenderLastAuthor', 'GenderLastCorrespondingAuthor']
+
+
+# Function used to add a batch of sampled articles to the running totals of the sampling mode
+def accumulateSummary(summary, journalsData):
+    for articles in journalsData.values():
+        for column, values, mask in zip(articles.columns, articles.values, articles.masks):
+            if mask is not None:
+                # Count, sum and sum of squares of the non-missing values
+                totals = summary.setdefault(column, [0, 0.0, 0.0])
+                for value, missing in zip(values, mask):
+                    if not missing:
+                        totals[0] += 1
+                        totals[1] += value
+                        totals[2] += value * value
+            elif column in summaryCategoryColumns:
+                counts = summary.setdefault(column, {})
+                for value in values:
+                    counts[value] = counts.get(value, 0) + 1
+
+
+# Function used to print the sampled metrics with their 95% confidence intervals
+def printSummary(summary):
+    print("Estimated metrics (mean or share, 95% confidence interval, sample size):")
+    for column in tsvHeader:
+        if column not in summary:
+            continue
+        totals = summary[column]
+        if isinstance(totals, list):
+            n, total, squares = totals
+            if n == 0:
+                continue
+            mean = total / n
+            variance = max(squares / n - mean * mean, 0.0) * n / (n - 1) if n > 1 else 0.0
+            margin = 1.96 * math.sqrt(variance / n)
+            print(f"  {column}: {mean:.4f} ± {margin:.4f} (n={n})")
+        else:
+            n = sum(totals.values())
+            for value, count in sorted(totals.items(), key=lambda item: -item[1]):
+                share = count / n
+                margin = 1.96 * math.sqrt(share * (1 - share) / n)
+                print(f"  {column}={value}: {share:.4f} ± {margin:.4f} (n={n})")
+
+
+# Raw fields kept in the intermediate extract, enough to recompute every derived column without the xml
+extractKeys = ['pmid', 'pubDateYear', 'journalTitle', 'journalIso', 'articleTitle', 'pagination', 'pubType',
+               'abstract', 'abstractSections', 'languages', 'authors', 'history', 'fields']
+
+
+# Stage writing the raw fields of every article to a gzip compressed JSON lines file, see reEnrich
+class ExtractWriter:
+    needs = ['abstract', 'authors', 'review', 'fields']
+
+    def __init__(self, fileName):
+        self.file = gzip.open(fileName, 'wt', encoding='utf-8')
+
+    # Stage entry point: append the articles of a batch to the extract
+    def processBatch(self, rawArticles, genders, countries):
+        for raw in rawArticles:
+            self.file.write(json.dumps([raw[key] for key in extractKeys], separators=(',', ':')) + '\n')
+
+    def close(self):
+        self.file.close()
+
+
+# Function used to get the extract file of an input file. A resumed file gets a new part starting at the
+# checkpoint, so the part left behind by a crashed run is kept as it is.
+def extractFileName(extractDir, inputFile, skipArticles=0):
+    name = os.path.basename(inputFile).replace('.xml.gz', '')
+    return os.path.join(extractDir, f"{name}.{skipArticles}.jsonl.gz")
+
+
+# Function used to read the articles of an extract back, in the form extractArticle returns them
+def readExtract(fileName):
+    try:
+        with gzip.open(fileName, 'rt', encoding='utf-8') as extractFile:
+            for line in extractFile:
+                raw = dict(zip(extractKeys, json.loads(line)))
+                # Extracts written before the extra fields were kept have no 'fields', they are None then
+                raw.setdefault('fields', None)
+                raw.update({'english': True, 'overBudget': [], 'timeSpent': 0.0})
+                yield raw
+    except (EOFError, json.JSONDecodeError):
+        # Part of a run that crashed while writing it, the articles after the checkpoint are in the next part
+        return
+
+
+# Function used to recompute the selected columns of the articles of one input file from its extract parts,
+# in a worker process. The values are grouped by the output file of their journal and written, as PMID followed
+# by the columns, to partialDir/<output file>/<input file>.tsv, so every output file can be joined with its own
+# values only.
+def reEnrichExtract(extractFiles, columns, partialDir, inputName):
+    needs = columnNeeds(columns)
+    columnIndexes = [allColumns.index(column) for column in columns]
+    fieldColumns = [column for column in columns if column in columnGroups['fields']]
+    numberOfArticles = 0
+    # Only one input file's articles are held, grouped by output file
+    outputValues = {}
+
+    def enrichArticles(rawArticles):
+        genders, countries = classifyAuthors(rawArticles, needs)
+        for raw in rawArticles:
+            if needs['readability'] or needs['sectionReadability']:
+                raw['english'] = raw['abstract'] == "NA" or isEnglishAbstract(raw['languages'], raw['abstract'])
+            articleData = enrichArticle(raw, needs, genders, countries)
+            outputValues.setdefault(cleanFileName(raw['journalIso']), []).append(
+                [raw['pmid']] + [articleData[i] for i in columnIndexes])
+
+    pendingArticles = []
+    for raw in itertools.chain.from_iterable(readExtract(fileName) for fileName in extractFiles):
+        if raw['fields'] is None:
+            if fieldColumns:
+                raise ValueError(f"{', '.join(fieldColumns)} cannot be recomputed, the extract of {inputName} was "
+                                 "written without the extra fields")
+            raw['fields'] = {}
+        pendingArticles.append(raw)
+        if len(pendingArticles) >= defaultBatchSize:
+            enrichArticles(pendingArticles)
+            numberOfArticles += len(pendingArticles)
+            pendingArticles = []
+    enrichArticles(pendingArticles)
+    numberOfArticles += len(pendingArticles)
+
+    for cleanName, rows in outputValues.items():
+        os.makedirs(os.path.join(partialDir, cleanName), exist_ok=True)
+        with open(os.path.join(partialDir, cleanName, inputName + '.tsv'), 'w', newline='', encoding='utf-8') as tsvFile:
+            csv.writer(tsvFile, delimiter='\t').writerows(rows)
+
+    return numberOfArticles
+
+
+# Function used to open a (compressed) .tsv file for writing as text, based on its extension, see openTsv
+def openTsvForWriting(fileName):
+    if fileName.endswith('.gz'):
+        return gzip.open(fileName, 'wt', newline='', encoding='utf-8')
+    if fileName.endswith('.zst'):
+        if zstandard is None:
+            raise ImportError("The zstandard package is needed to write " + fileName)
+        return io.TextIOWrapper(zstandard.ZstdCompressor().stream_writer(open(fileName, 'wb')), newline='',
+                                encoding='utf-8')
+    return open(fileName, 'w', newline='', encoding='utf-8')
+
+
+# Function used to get the name of an output file without its directory and extensions, as cleanFileName gives it
+def outputFileKey(fileName):
+    name = os.path.basename(fileName)
+    for extension in compressionExtensions.values():
+        if extension and name.endswith('.tsv' + extension):
+            return name[:-len(extension) - 4]
+    return name[:-4] if name.endswith('.tsv') else name
+
+
+# Function used to replace the recomputed columns of an output file with the values of its partial files, in a
+# worker process. The file is only rewritten when one of its values changed. Returns the matched and changed rows.
+def rewriteOutputFile(fileName, columns, partialDir):
+    valuesDir = os.path.join(partialDir, outputFileKey(fileName))
+    if not os.path.isdir(valuesDir):
+        return 0, 0
+    # Later input files win, like the rows of a resumed file
+    values = {}
+    for partialFile in sorted(os.listdir(valuesDir)):
+        with open(os.path.join(valuesDir, partialFile), 'r', newline='', encoding='utf-8') as tsvFile:
+            for row in csv.reader(tsvFile, delimiter='\t'):
+                values[row[0]] = row[1:]
+
+    rows = readTsv(fileName)
+    header = next(rows)
+    if 'PMID' not in header:
+        raise ValueError(fileName + " has no PMID column, its rows cannot be matched to the extract")
+    pmidIndex = header.index('PMID')
+    # Columns of the file that were recomputed, with their position in the recomputed values
+    replaced = [(header.index(column), i) for i, column in enumerate(columns) if column in header]
+
+    numberOfRows = 0
+    changedRows = 0
+    tempFile = os.path.join(os.path.dirname(fileName), '.reEnrich-' + os.path.basename(fileName))
+    try:
+        with openTsvForWriting(tempFile) as tsvFile:
+            tsvWriter = csv.writer(tsvFile, delimiter='\t')
+            tsvWriter.writerow(header)
+            for row in rows:
+                articleValues = values.get(row[pmidIndex])
+                if articleValues is not None:
+                    changed = False
+                    for headerIndex, valueIndex in replaced:
+                        if row[headerIndex] != articleValues[valueIndex]:
+                            row[headerIndex] = articleValues[valueIndex]
+                            changed = True
+                    numberOfRows += 1
+                    changedRows += changed
+                tsvWriter.writerow(row)
+        if changedRows:
+            os.replace(tempFile, fileName)
+    finally:
+        if os.path.exists(tempFile):
+            os.remove(tempFile)
+    return numberOfRows, changedRows
+
+
+# Function used to recompute derived columns (e.g. gender and country after a change to determineGender or vars.py)
+# from the extracts written with --extract-dir, and to update them in the output files, without reading the xml.
+# The input files are re-enriched in parallel, then the output files whose values changed are rewritten in parallel.
+def reEnrich(extractDir, columns='gender,country', outputDir='./tsvFiles', workers=4):
+    start = timer()
+    columns = selectColumns(columns)
+
+    # Group the extract parts by input file
+    parts = {}
+    for fileName in sorted(glob.glob(os.path.join(extractDir, '*.jsonl.gz'))):
+        parts.setdefault(os.path.basename(fileName).split('.')[0], []).append(fileName)
+    for name in parts:
+        parts[name].sort(key=lambda fileName: int(os.path.basename(fileName).split('.')[1]))
+
+    context = multiprocessing.get_context('fork')
+    with tempfile.TemporaryDirectory() as partialDir:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            numberOfArticles = sum(pool.map(reEnrichExtract, parts.values(), itertools.repeat(columns),
+                                            itertools.repeat(partialDir), parts.keys()))
+
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            fileNames = outputFiles(outputDir)
+            results = list(pool.map(rewriteOutputFile, fileNames, itertools.repeat(columns),
+                                    itertools.repeat(partialDir)))
+    numberOfRows = sum(rows for rows, changedRows in results)
+    changedRows = sum(changedRows for rows, changedRows in results)
+    changedFiles = sum(1 for rows, changedRows in results if changedRows)
+
+    print(f"Re-enriched {numberOfArticles} articles from {len(parts)} extracts, {changedRows} of {numberOfRows} "
+          f"rows changed, rewrote {changedFiles} of {len(fileNames)} output files")
+    print("Total time for script to run: " + str(timedelta(seconds=timer() - start)))
+
+
+# Uncompressed bytes between two seek points of the PMID index
+defaultSeekPointSpacing = 4 * 1024 * 1024
+
+articleStartTag = b'<PubmedArticle>'
+articleEndTag = b'</PubmedArticle>'
+pmidPattern = re.compile(rb'<PMID[^>]*>\s*(\d+)\s*</PMID>')
+
+
+# Function used to find the PMID, uncompressed byte offset and length of every PubmedArticle of an xml stream,
+# by scanning the bytes for the article tags instead of parsing the xml
+def scanArticleOffsets(stream, chunkSize=16 * 1024 * 1024):
+    buffer = b''
+    bufferStart = 0
+    while True:
+        chunk = stream.read(chunkSize)
+        buffer += chunk
+        position = 0
+        while True:
+            start = buffer.find(articleStartTag, position)
+            if start < 0:
+                break
+            end = buffer.find(articleEndTag, start)
+            if end < 0:
+                break
+            end += len(articleEndTag)
+            # The first PMID of an article is its MedlineCitation PMID
+            match = pmidPattern.search(buffer, start, end)
+            if match is not None:
+                yield match.group(1).decode(), bufferStart + start, end - start
+            position = end
+        if not chunk:
+            break
+
+        # Keep the unfinished article (or the end of a tag cut in two) for the next chunk
+        keep = buffer.find(articleStartTag, position)
+        if keep < 0:
+            keep = max(position, len(buffer) - len(articleStartTag))
+        bufferStart += keep
+        buffer = buffer[keep:]
+
+
+# Function used to get the file of the seek points of an input file, next to the index
+def seekPointsFile(indexFile, inputFile):
+    return os.path.splitext(os.path.abspath(indexFile))[0] + '-' + os.path.basename(inputFile).replace('.xml.gz', '') + '.gzidx'
+
+
+# Function used to build (or update) the PMID index of the input files: a sqlite database with the source file,
+# uncompressed offset and length of every article, plus the gzip seek points of every file when indexed_gzip
+# is installed. An article found in several files is taken from the last one, like the updates of the baseline.
+# Paths are stored absolute, so the index can be used from any working directory.
+def buildPmidIndex(inputFiles, indexFile, spacing=defaultSeekPointSpacing):
+    if indexed_gzip is None:
+        print("indexed_gzip is not installed, no seek points are recorded and every fetched article will be read by "
+              "decompressing its file from the start", file=sys.stderr)
+    connection = sqlite3.connect(indexFile)
+    connection.execute('CREATE TABLE IF NOT EXISTS articles (pmid TEXT PRIMARY KEY, file TEXT, offset INTEGER, '
+                       'length INTEGER)')
+    connection.execute('CREATE TABLE IF NOT EXISTS files (file TEXT PRIMARY KEY, seekPoints TEXT)')
+
+    for inputFile in inputFiles:
+        inputFile = os.path.abspath(inputFile)
+        t1 = time.time()
+        if indexed_gzip is not None:
+            stream = indexed_gzip.IndexedGzipFile(inputFile, spacing=spacing)
+        else:
+            stream = gzip.open(inputFile, 'rb')
+
+        with stream:
+            connection.execute('DELETE FROM articles WHERE file = ?', (inputFile,))
+            numberOfArticles = 0
+            offsets = scanArticleOffsets(stream)
+            for entries in iter(lambda: list(itertools.islice(offsets, 10000)), []):
+                connection.executemany('INSERT OR REPLACE INTO articles VALUES (?, ?, ?, ?)',
+                                       [(pmid, inputFile, offset, length) for pmid, offset, length in entries])
+                numberOfArticles += len(entries)
+
+            # The seek points were recorded while the file was read
+            seekPoints = None
+            if indexed_gzip is not None:
+                seekPoints = seekPointsFile(indexFile, inputFile)
+                stream.export_index(seekPoints)
+        connection.execute('INSERT OR REPLACE INTO files VALUES (?, ?)', (inputFile, seekPoints))
+        connection.commit()
+        print(f"Indexed {numberOfArticles} articles of {inputFile} in {time.time() - t1:.2f}s")
+
+    connection.close()
+
+
+# Function used to read the PubmedArticle elements of a list of PMIDs through the PMID index, yielding
+# (pmid, element) pairs grouped by file. Without indexed_gzip a file is decompressed up to the articles.
+def fetchArticleElements(pmids, indexFile):
+    connection = sqlite3.connect(indexFile)
+    locations = {}
+    for pmid in pmids:
+        row = connection.execute('SELECT file, offset, length FROM articles WHERE pmid = ?', (str(pmid),)).fetchone()
+        if row is None:
+            print(f"PMID {pmid} is not in {indexFile}", file=sys.stderr)
+            continue
+        locations.setdefault(row[0], []).append((row[1], row[2], str(pmid)))
+    seekPoints = dict(connection.execute('SELECT file, seekPoints FROM files').fetchall())
+    connection.close()
+
+    for inputFile, articles in locations.items():
+        if indexed_gzip is not None and seekPoints.get(inputFile):
+            stream = indexed_gzip.IndexedGzipFile(inputFile, index_file=seekPoints[inputFile])
+        else:
+            if indexed_gzip is None:
+                reason = "indexed_gzip is not installed"
+            else:
+                reason = "the index has no seek points for it, rebuild it with indexed_gzip installed"
+            print(f"Reading {inputFile} from the start to fetch its articles, {reason}", file=sys.stderr)
+            stream = gzip.open(inputFile, 'rb')
+        with stream:
+            # Read the articles in file order, so a plain gzip stream only moves forward
+            for offset, length, pmid in sorted(articles):
+                stream.seek(offset)
+                yield pmid, ET.fromstring(stream.read(length))
+
+
+# Function used to fetch and enrich the articles of a list of PMIDs through the PMID index, see iterArticles
+def fetchArticles(pmids, indexFile, columns=None):
+    for pmid, article in fetchArticleElements(pmids, indexFile):
+        yield enrichArticleElement(article, columns)
+
+
+# Function used to print the rows of the fetched PMIDs as .tsv, e.g. to debug one bad row
+def printFetchedArticles(pmids, indexFile, columns=None):
+    columns = selectColumns(columns)
+    tsvWriter = csv.writer(sys.stdout, delimiter='\t')
+    tsvWriter.writerow(columns)
+    for record in fetchArticles(pmids, indexFile, columns):
+        tsvWriter.writerow(["NA" if record[column] is None else record[column] for column in columns])
+
+
+# Function used to run one job of the service mode in a worker process. A job is a dictionary with either
+# "files" (paths of .xml or .xml.gz files) or "xml" (raw PubmedArticle XML), optionally "columns", and
+# optionally "outputDir" to write .tsv files there instead of returning the rows.
+def runJob(job):
+    columns = withReadabilityStatus(selectColumns(job.get('columns')))
+    outputDir = job.get('outputDir')
+
+    sources = []
+    if 'xml' in job:
+        xml = job['xml'].strip()
+        if not xml.startswith('<?xml') and not xml.startswith('<PubmedArticleSet'):
+            xml = '<PubmedArticleSet>' + xml + '</PubmedArticleSet>'
+        sources.append(io.BytesIO(xml.encode('utf-8')))
+    for fileName in job.get('files', []):
+        sources.append(gzip.open(fileName, 'rb') if fileName.endswith('.gz') else fileName)
+
+    rows = []
+    outputs = set()
+
+    def collect(journalsData):
+        for journalIso, articles in journalsData.items():
+            if outputDir is not None:
+                outputs.add(f'{outputDir}/{cleanFileName(journalIso)}.tsv')
+            else:
+                rows.extend(articles.rows())
+        if outputDir is not None:
+            writeJournalsData(journalsData, columns, None, outputDir)
+
+    for source in sources:
+        collect(parsePubMedArticles(source, columns, flushBatch=collect))
+        if hasattr(source, 'close'):
+            source.close()
+
+    if outputDir is not None:
+        return {'outputs': sorted(outputs)}
+    return {'header': columns, 'rows': rows}
+
+
+# Request handler of the service mode: POST a JSON job (see runJob) and get the rows or output files back
+class JobRequestHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        self.sendJson(200, {'status': 'ok'})
+
+    def do_POST(self):
+        try:
+            job = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            result = self.server.pool.submit(runJob, job).result()
+        except Exception as e:
+            self.sendJson(400, {'error': str(e)})
+            return
+        self.sendJson(200, result)
+
+    def sendJson(self, status, data):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    # Unix socket clients have no address
+    def address_string(self):
+        return str(self.client_address[0]) if self.client_address else 'local'
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+# Function used to run the analyzer as a long-running service, on localhost HTTP or on a Unix socket.
+# The gender data, country names and Textatistic tables are loaded once at import, and the worker
+# processes are forked with them already in memory, so a job only pays for its own articles.
+def serve(port=8765, socketPath=None, workers=4):
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork'))
+    # Start the workers before the server threads, so they are forked from a single-threaded process
+    list(pool.map(len, [''] * workers))
+
+    if socketPath is not None:
+        if os.path.exists(socketPath):
+            os.remove(socketPath)
+        server = ThreadingUnixHTTPServer(socketPath, JobRequestHandler)
+        print("Serving on " + socketPath)
+    else:
+        server = ThreadingHTTPServer(('127.0.0.1', port), JobRequestHandler)
+        print(f"Serving on http://127.0.0.1:{port}")
+    server.pool = pool
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        pool.shutdown()
+
+
+def main(columns=None, batchSize=None, sampleFraction=None, sampleFirst=None, seed=0,
+         compression='none', compressionLevel=None, compressionThreads=4, memoryBudget=None, spillDir=None,
+         duplicateIndex=None, duplicatePairs='./duplicatePairs.tsv', duplicateThreshold=0.5, collaborationDir=None,
+         checkpointDir=None, checkpointInterval=defaultCheckpointInterval, queueDir=None, workerId=None,
+         leaseTime=defaultLeaseTime, stageTimeBudget=None, articleTimeBudget=None,
+         quarantineFile='./problematicAbstracts.tsv', extractDir=None):
 
     
     start = timer()
 
-    for gzipFile in glob.glob('./xmlFiles/pubmed24n*.xml.gz'):
-        xmlFile = gzipFile.replace('.xml.gz', '.xml')
+    columns = withReadabilityStatus(selectColumns(columns))
+
+    # In sampling mode nothing is written, the sampled articles only feed the estimates
+    sampler = makeSampler(sampleFraction, sampleFirst, seed)
+    summary = {}
+    projectedTime = 0.0
+
+    # Compressed output is written on background threads
+    writer = None
+    if compression != 'none' and sampler is None:
+        writer = CompressedTsvWriter(compression, compressionLevel, compressionThreads)
+
+    # Articles running over the time budget are marked and quarantined instead of stalling the run
+    budget = None
+    if stageTimeBudget is not None or articleTimeBudget is not None:
+        budget = TimeBudget(stageTimeBudget, articleTimeBudget)
+
+    # Optional stages that see every batch of extracted articles
+    stages = []
+    if duplicateIndex is not None and sampler is None:
+        duplicates = DuplicateIndex(duplicateIndex, duplicatePairs, threshold=duplicateThreshold)
+        stages.append(duplicates)
+    # With checkpoints the collaboration counts are kept per input file and saved with its checkpoints, see savePartials
+    if collaborationDir is not None and sampler is None and checkpointDir is None and queueDir is None:
+        collaboration = CollaborationMatrices()
+        stages.append(collaboration)
+
+    # With a shared queue directory every worker writes to its own shard of the output, and the checkpoints
+    # are shared so a worker reclaiming a dead worker's file can resume it
+    outputDir = './tsvFiles'
+    if queueDir is not None and sampler is None:
+        if workerId is None:
+            workerId = f"{socket.gethostname()}-{os.getpid()}"
+        if checkpointDir is None:
+            checkpointDir = os.path.join(queueDir, 'checkpoints')
+        outputDir = os.path.join('./tsvShards', workerId)
+        os.makedirs(queueDir, exist_ok=True)
+        os.makedirs(outputDir, exist_ok=True)
+    else:
+        queueDir = None
 
-        extractGzipToXml(gzipFile, xmlFile)                                 # Extract and convert to xml
-        
-        t1 = time.time()
+    if checkpointDir is not None and sampler is None:
+        os.makedirs(checkpointDir, exist_ok=True)
+    if extractDir is not None and sampler is None:
+        os.makedirs(extractDir, exist_ok=True)
 
-        journalsData = parsePubMedArticles(xmlFile)                         # Parse the xml file
+    inputFiles = sorted(glob.glob('./xmlFiles/pubmed24n*.xml.gz'))
+    for gzipFile, lease in claimInputFiles(inputFiles, queueDir, checkpointDir, workerId, leaseTime):
+        xmlFile = gzipFile.replace('.xml.gz', '.xml')
+        if queueDir is not None:
+            # Extract to local disk, the input directory is shared with the other workers
+            xmlFile = os.path.join(tempfile.gettempdir(), workerId + '-' + os.path.basename(xmlFile))
+
+        # Resume from the checkpoint of the file, if an earlier run stopped while processing it
+        checkpoint = None
+        skipArticles = 0
+        if checkpointDir is not None and sampler is None:
+            checkpointFile = os.path.join(checkpointDir, os.path.basename(gzipFile) + '.json')
+            checkpoint = loadCheckpoint(checkpointFile)
+            if checkpoint is not None and checkpoint['complete']:
+                print("Skipping " + gzipFile + ", it was already processed")
+                continue
+            if checkpoint is not None:
+                restored = restoreCheckpoint(checkpoint)
+                if writer is not None:
+                    writer.forget(restored)
+                skipArticles = checkpoint['articles']
+                print(f"Resuming {gzipFile} after {skipArticles} articles")
+            else:
+                saveCheckpoint(checkpointFile, gzipFile, 0, outputSizes(outputDir), outputDir=outputDir)
+
+        # Collaboration counts and quarantined articles of this file, picked up from its checkpoint when resuming
+        fileCollaboration = None
+        fileQuarantine = []
+        if checkpointDir is not None and sampler is None:
+            partials = checkpoint.get('partials', {}) if checkpoint is not None else {}
+            if collaborationDir is not None:
+                if 'collaboration' in partials:
+                    fileCollaboration = CollaborationMatrices.load(partials['collaboration'])
+                else:
+                    fileCollaboration = CollaborationMatrices()
+            if 'quarantine' in partials:
+                fileQuarantine = list(itertools.islice(readTsv(partials['quarantine']), 1, None))
+
+        # What this worker has written when it last checkpointed the file, restored if it loses the lease
+        restorePoint = {'outputDir': outputDir, 'offsets': outputSizes(outputDir)}
+
+        tFile = time.time()
+
+        if sampler is not None:
+            # Parse straight from the gzip stream, with --sample-first the rest of the file is never decompressed
+            stats = {}
+            with open(gzipFile, 'rb') as compressedFile:
+                with gzip.GzipFile(fileobj=compressedFile) as xmlStream:
+                    journalsData = parsePubMedArticles(xmlStream, columns, batchSize,
+                                                       lambda batch: accumulateSummary(summary, batch), sampler, stats,
+                                                       maxArticles=sampleFirst)
+                    # Share of the compressed file read, used to scale the estimate up when parsing stopped early
+                    readShare = compressedFile.tell() / max(os.path.getsize(gzipFile), 1)
+            accumulateSummary(summary, journalsData)
+            if sampleFirst is None or stats['articles'] < sampleFirst:
+                readShare = 1.0
+
+            # Scale the time spent on the sampled articles up to every article in the file
+            elapsed = time.time() - tFile
+            if stats['sampled'] > 0:
+                perArticle = stats['processingTime'] / stats['sampled']
+                projected = elapsed + perArticle * (stats['articles'] - stats['sampled'])
+            else:
+                perArticle = 0.0
+                projected = elapsed
+            projected /= max(readShare, 1e-6)
+            projectedTime += projected
+            print(f"Sampled {stats['sampled']} of {stats['articles']} articles in {gzipFile} "
+                  f"(~{round(stats['articles'] / max(readShare, 1e-6))} in the file): "
+                  f"{perArticle * 1000:.2f} ms/article, projected full time {timedelta(seconds=projected)}")
+            continue
 
-        t2 = time.time()
-        print("Total time to parse " + xmlFile + ": " + str(t2-t1))
+        extractGzipToXml(gzipFile, xmlFile)                                 # Extract and convert to xml
 
-        t3 = time.time()
-        # Clean journal/article name and write data to tsv file 
-        for journalIso, articles in journalsData.items():
-            cleanName = cleanFileName(journalIso)
-            tsvFile= f'./tsvFiles/{cleanName}.tsv'
-            writeToTsv(tsvFile, articles)
+        t1 = time.time()
 
-        t4 = time.time()
-        print("Total time to write to .tsv files: " + str(t4-t3))
-        os.remove(xmlFile)
+        extractWriter = None
+        try:
+            # Parse the xml file, full batches are written out to the tsv files while parsing
+            # With a memory budget they are grouped by journal first, spilling to disk when the budget is exceeded
+            stats = {'quarantine': fileQuarantine}
+            if memoryBudget is not None:
+                spiller = JournalSpiller(memoryBudget * 1024 * 1024, spillDir)
+                flushBatch = spiller.add
+            elif checkpointDir is not None:
+                # Take a checkpoint once checkpointInterval more articles have been written out
+                progress = {'written': skipArticles, 'checkpointed': skipArticles, 'checkpointTime': 0.0}
+
+                def flushBatch(batch):
+                    writeJournalsData(batch, columns, writer, outputDir)
+                    progress['written'] += sum(len(articles) for articles in batch.values())
+                    if progress['written'] - progress['checkpointed'] >= checkpointInterval:
+                        tCheckpoint = time.perf_counter()
+                        if writer is not None:
+                            writer.flush()
+                        checkLease(lease)
+                        offsets = outputSizes(outputDir)
+                        partials = savePartials(checkpointFile, progress['written'], fileCollaboration,
+                                                stats['quarantine'])
+                        saveCheckpoint(checkpointFile, gzipFile, progress['written'], offsets, outputDir=outputDir,
+                                       partials=partials)
+                        restorePoint['offsets'] = offsets
+                        progress['checkpointed'] = progress['written']
+                        progress['checkpointTime'] += time.perf_counter() - tCheckpoint
+            else:
+                flushBatch = lambda batch: writeJournalsData(batch, columns, writer, outputDir)
+            # Stop writing as soon as another worker took the file over
+            if lease is not None:
+                flushFile = flushBatch
+
+                def flushBatch(batch):
+                    checkLease(lease)
+                    flushFile(batch)
+
+            # Keep the raw fields of the file, so derived columns can be recomputed later without the xml
+            fileStages = stages
+            if fileCollaboration is not None:
+                fileStages = fileStages + [fileCollaboration]
+            if extractDir is not None:
+                extractWriter = ExtractWriter(extractFileName(extractDir, gzipFile, skipArticles))
+                fileStages = fileStages + [extractWriter]
+
+            journalsData = parsePubMedArticles(xmlFile, columns, batchSize, flushBatch, None, stats, fileStages,
+                                               skipArticles, budget)
+            if extractDir is not None:
+                extractWriter.close()
+
+            t2 = time.time()
+            print("Total time to parse " + xmlFile + ": " + str(t2-t1))
+            printDedupReport(stats)
+            printLanguageReport(stats)
+            printBudgetReport(stats, xmlFile)
+            if stats['quarantine'] and checkpointDir is None:
+                writeProblematicAbstracts(quarantineFile, stats['quarantine'])
+
+            t3 = time.time()
+            checkLease(lease)
+            # Clean journal/article name and write the remaining data to tsv file 
+            if memoryBudget is not None:
+                spiller.add(journalsData)
+                print(f"Spilled {len(spiller.runFiles)} run files to disk")
+                writeJournalGroups(spiller, columns, writer, outputDir, batchSize or defaultBatchSize)
+            else:
+                writeJournalsData(journalsData, columns, writer, outputDir)
+
+            t4 = time.time()
+            print("Total time to write to .tsv files: " + str(t4-t3))
+            os.remove(xmlFile)
+
+            # Mark the file as done, so a restarted run skips it
+            if checkpointDir is not None:
+                if writer is not None:
+                    writer.flush()
+                checkLease(lease)
+                articles = stats['articles'] + skipArticles
+                partials = savePartials(checkpointFile, articles, fileCollaboration, stats['quarantine'])
+                saveCheckpoint(checkpointFile, gzipFile, articles, {}, complete=True, outputDir=outputDir,
+                               partials=partials)
+                if memoryBudget is None:
+                    print(f"Time spent on checkpoints: {progress['checkpointTime']:.3f}s")
+        except LeaseLost:
+            # The worker that took the file over resumes it from its last checkpoint, undo what was written since
+            print("Lost the lease on " + gzipFile + ", discarding what was written of it since its last checkpoint")
+            if writer is not None:
+                writer.flush()
+            if memoryBudget is not None:
+                spiller.close()
+            restored = restoreCheckpoint(restorePoint)
+            if writer is not None:
+                writer.forget(restored)
+            if extractWriter is not None:
+                extractWriter.close()
+                os.remove(extractFileName(extractDir, gzipFile, skipArticles))
+            if os.path.exists(xmlFile):
+                os.remove(xmlFile)
+
+    if writer is not None:
+        writer.close()
+
+    if duplicateIndex is not None and sampler is None:
+        duplicates.close()
+        print(f"Found {duplicates.numberOfPairs} near-duplicate abstract pairs, written to {duplicatePairs}")
+
+    # With checkpoints the counts and quarantine are rebuilt from the partials of every complete file. With a
+    # queue every worker writes the totals of the files complete so far, the last one to finish writes them all.
+    if checkpointDir is not None and sampler is None:
+        collaboration, quarantine = mergePartials(inputFiles, checkpointDir)
+        if quarantine:
+            tempFile = quarantineFile + f".{os.getpid()}.tmp"
+            removePartial(tempFile)
+            writeProblematicAbstracts(tempFile, quarantine)
+            os.replace(tempFile, quarantineFile)
+
+    if collaborationDir is not None and sampler is None:
+        collaboration.write(collaborationDir)
+        print("Collaboration matrices written to " + collaborationDir)
+
+    if sampler is not None:
+        printSummary(summary)
+        print("Projected time for a full run (excluding writing .tsv files): " + str(timedelta(seconds=projectedTime)))
 
     end = timer()
     print("Total time for script to run: " + str(timedelta(seconds=end-start)))
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description='PubMed Journal Analyzer')
+    parser.add_argument('--columns', default=None,
+                        help='Comma separated list of output columns and/or column groups (' + ', '.join(columnGroups) + '). Defaults to all columns')
+    parser.add_argument('--batch-size', type=int, default=defaultBatchSize,
+                        help='Number of articles buffered in memory before they are written out')
+    parser.add_argument('--sample-fraction', type=float, default=None,
+                        help='Estimate mode: only process this fraction of the articles of every file, e.g. 0.01')
+    parser.add_argument('--sample-first', type=int, default=None,
+                        help='Estimate mode: only process the first N articles of every file')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Seed used to pick the sampled articles')
+    parser.add_argument('--compression', choices=list(compressionExtensions), default='none',
+                        help='Compression of the .tsv output files')
+    parser.add_argument('--compression-level', type=int, default=None,
+                        help='Compression level (defaults to 6 for gzip and 3 for zstd)')
+    parser.add_argument('--compression-threads', type=int, default=4,
+                        help='Number of threads used to compress the output')
+    parser.add_argument('--memory-budget', type=float, default=None,
+                        help='Group every file by journal before writing it out, spilling to disk past this many MB')
+    parser.add_argument('--spill-dir', default=None,
+                        help='Directory for the temporary files of --memory-budget (defaults to the system temp directory)')
+    parser.add_argument('--duplicate-index', default=None,
+                        help='Detect near-duplicate abstracts using (and updating) this MinHash/LSH index file')
+    parser.add_argument('--duplicate-pairs', default='./duplicatePairs.tsv',
+                        help='File the near-duplicate pairs are appended to')
+    parser.add_argument('--duplicate-threshold', type=float, default=0.5,
+                        help='Minimum estimated Jaccard similarity of the reported pairs')
+    parser.add_argument('--collaboration-dir', default=None,
+                        help='Accumulate country collaboration and gender co-authorship counts and write them to this directory')
+    parser.add_argument('--checkpoint-dir', default=None,
+                        help='Keep checkpoints in this directory, so a restarted run resumes where the last one stopped')
+    parser.add_argument('--checkpoint-interval', type=int, default=defaultCheckpointInterval,
+                        help='Number of articles written out between two checkpoints inside a file '
+                             '(with --memory-budget only whole files are checkpointed)')
+    parser.add_argument('--queue-dir', default=None,
+                        help='Shared directory used to split the input files between several workers through leases; '
+                             'every worker writes to its own shard in ./tsvShards')
+    parser.add_argument('--worker-id', default=None,
+                        help='Name of this worker in the queue (defaults to host name and process id)')
+    parser.add_argument('--lease-time', type=float, default=defaultLeaseTime,
+                        help='Seconds after which the lease of a worker that stopped sending heartbeats is reclaimed')
+    parser.add_argument('--merge-shards', action='store_true',
+                        help='Merge the worker shards in ./tsvShards into ./tsvFiles and exit')
+    parser.add_argument('--stage-time-budget', type=float, default=None,
+                        help='Seconds an article may spend in author classification or readability scoring before the stage is abandoned')
+    parser.add_argument('--article-time-budget', type=float, default=None,
+                        help='Seconds an article may spend in all of these stages together')
+    parser.add_argument('--quarantine-file', default='./problematicAbstracts.tsv',
+                        help='File the articles running over their time budget are written to')
+    parser.add_argument('--extract-dir', default=None,
+                        help='Also keep a compact extract of the raw fields of every input file in this directory')
+    parser.add_argument('--re-enrich', default=None, metavar='EXTRACT_DIR',
+                        help='Recompute the --re-enrich-columns of ./tsvFiles from the extracts in EXTRACT_DIR and exit')
+    parser.add_argument('--re-enrich-columns', default='gender,country',
+                        help='Columns and/or column groups recomputed by --re-enrich')
+    parser.add_argument('--build-pmid-index', default=None, metavar='INDEX_FILE',
+                        help='Index the articles of ./xmlFiles by PMID in INDEX_FILE and exit')
+    parser.add_argument('--fetch', default=None, metavar='PMIDS',
+                        help='Print the --columns of these comma separated PMIDs (or @file with one per line) '
+                             'using --pmid-index and exit')
+    parser.add_argument('--pmid-index', default='./pmidIndex.sqlite',
+                        help='PMID index used by --fetch')
+    parser.add_argument('--serve', action='store_true',
+                        help='Run as a service accepting jobs over localhost HTTP (or --socket) instead of processing ./xmlFiles')
+    parser.add_argument('--port', type=int, default=8765,
+                        help='Port of the service')
+    parser.add_argument('--socket', default=None,
+                        help='Serve on this Unix socket instead of a localhost port')
+    parser.add_argument('--workers', type=int, default=4,
+                        help='Number of worker processes of the service and of --re-enrich')
+    args = parser.parse_args()
+
+    if args.merge_shards:
+        mergeShards('./tsvShards', './tsvFiles', args.compression_level, args.compression_threads)
+    elif args.serve:
+        serve(args.port, args.socket, args.workers)
+    elif args.re_enrich:
+        reEnrich(args.re_enrich, args.re_enrich_columns, './tsvFiles', args.workers)
+    elif args.build_pmid_index:
+        buildPmidIndex(sorted(glob.glob('./xmlFiles/pubmed24n*.xml.gz')), args.build_pmid_index)
+    elif args.fetch:
+        if args.fetch.startswith('@'):
+            with open(args.fetch[1:]) as pmidFile:
+                pmids = [line.strip() for line in pmidFile if line.strip()]
+        else:
+            pmids = args.fetch.split(',')
+        printFetchedArticles(pmids, args.pmid_index, args.columns)
+    else:
+        main(columns=args.columns, batchSize=args.batch_size, sampleFraction=args.sample_fraction,
+             sampleFirst=args.sample_first, seed=args.seed, compression=args.compression,
+             compressionLevel=args.compression_level, compressionThreads=args.compression_threads,
+             memoryBudget=args.memory_budget, spillDir=args.spill_dir, duplicateIndex=args.duplicate_index,
+             duplicatePairs=args.duplicate_pairs, duplicateThreshold=args.duplicate_threshold,
+             collaborationDir=args.collaboration_dir, checkpointDir=args.checkpoint_dir,
+             checkpointInterval=args.checkpoint_interval, queueDir=args.queue_dir, workerId=args.worker_id,
+             leaseTime=args.lease_time, stageTimeBudget=args.stage_time_budget,
+             articleTimeBudget=args.article_time_budget, quarantineFile=args.quarantine_file,
+             extractDir=args.extract_dir)
@@ -0,0 +1,26 @@
+import importlib
+import os
+import shutil
+import sys
+import tempfile
+
+repoDir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if repoDir not in sys.path:
+    sys.path.insert(0, repoDir)
+
+
+# Function used to import analyze, which loads the genderize data from the working directory when it is
+# imported. The data is written to a temporary directory that is only the working directory during the import.
+def importAnalyze():
+    if 'analyze' in sys.modules:
+        return sys.modules['analyze']
+    workDir = tempfile.mkdtemp()
+    previousDir = os.getcwd()
+    try:
+        with open(os.path.join(workDir, 'output_genderize.csv'), 'w', encoding='utf-8') as genderFile:
+            genderFile.write('name,gender,prob\nmary,female,0.99\njohn,male,0.99\n')
+        os.chdir(workDir)
+        return importlib.import_module('analyze')
+    finally:
+        os.chdir(previousDir)
+        shutil.rmtree(workDir)
@@ -0,0 +1,144 @@
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+
+from support import importAnalyze
+
+analyze = None
+
+
+def setUpModule():
+    global analyze
+    analyze = importAnalyze()
+
+
+journals = ['J Biol', 'Nat Med', 'Cell Rep']
+foreNames = ['Mary', 'John', 'Alex', None]
+affiliations = ['Charite, Berlin, Germany.', 'Peking University, Beijing, China.',
+                'Department of Biology, Harvard University, Boston, MA, USA.']
+
+
+# Function used to build a PubmedArticle element of the test input, the fields cycle through a few journals and authors
+def pubmedArticle(pmid):
+    journal = journals[pmid % len(journals)]
+    authors = ''
+    for i in range(1 + pmid % 3):
+        foreName = foreNames[(pmid + i) % len(foreNames)]
+        authors += ('<Author>' + (f'<ForeName>{foreName}</ForeName>' if foreName else '') +
+                    f'<AffiliationInfo><Affiliation>{affiliations[(pmid + i) % len(affiliations)]}</Affiliation>'
+                    '</AffiliationInfo></Author>')
+    return (f'<PubmedArticle><MedlineCitation><PMID Version="1">{pmid}</PMID><Article><Journal><JournalIssue>'
+            f'<PubDate><Year>{2000 + pmid % 5}</Year></PubDate></JournalIssue><Title>{journal} Full</Title>'
+            f'<ISOAbbreviation>{journal}</ISOAbbreviation></Journal><ArticleTitle>Title {pmid}</ArticleTitle>'
+            f'<Abstract><AbstractText>Abstract of article {pmid}. It is short.</AbstractText></Abstract>'
+            f'<AuthorList>{authors}</AuthorList><Language>eng</Language></Article></MedlineCitation>'
+            '<PubmedData><History><PubMedPubDate PubStatus="received"><Year>2020</Year><Month>Apr</Month>'
+            f'<Day>{1 + pmid % 28}</Day></PubMedPubDate><PubMedPubDate PubStatus="accepted"><Year>2020</Year>'
+            '<Month>7</Month><Day>4</Day></PubMedPubDate></History></PubmedData></PubmedArticle>')
+
+
+class Crash(Exception):
+    pass
+
+
+class CheckpointResumeTest(unittest.TestCase):
+
+    columns = 'PMID,JournalIso,Abstract,gender,country,review'
+
+    def setUp(self):
+        self.workDir = tempfile.mkdtemp()
+        self.previousDir = os.getcwd()
+        os.chdir(self.workDir)
+        os.mkdir('xmlFiles')
+        pmid = 1
+        for fileNumber in (1, 2):
+            with gzip.open(f'xmlFiles/pubmed24n000{fileNumber}.xml.gz', 'wt', encoding='utf-8') as xmlFile:
+                xmlFile.write('<?xml version="1.0"?>\n<PubmedArticleSet>')
+                for _ in range(40):
+                    xmlFile.write(pubmedArticle(pmid))
+                    pmid += 1
+                xmlFile.write('</PubmedArticleSet>')
+
+    def tearDown(self):
+        os.chdir(self.previousDir)
+        shutil.rmtree(self.workDir)
+
+    def run(self, result=None):
+        writeJournalsData = analyze.writeJournalsData
+        CompressedTsvWriter = analyze.CompressedTsvWriter
+        try:
+            return super().run(result)
+        finally:
+            analyze.writeJournalsData = writeJournalsData
+            analyze.CompressedTsvWriter = CompressedTsvWriter
+
+    # Function used to run the analyzer into outputDir, crashing after the given numbers of written batches
+    def analyze(self, outputDir, crashes=(), **options):
+        writeJournalsData = analyze.writeJournalsData
+        CompressedTsvWriter = analyze.CompressedTsvWriter
+        os.mkdir('tsvFiles')
+        for crashAfter in crashes:
+            calls = [0]
+            writers = []
+
+            def recordedWriter(*args, **kwargs):
+                writers.append(CompressedTsvWriter(*args, **kwargs))
+                return writers[-1]
+
+            def crashingWrite(*args):
+                writeJournalsData(*args)
+                calls[0] += 1
+                if calls[0] == crashAfter:
+                    raise Crash()
+
+            analyze.writeJournalsData = crashingWrite
+            analyze.CompressedTsvWriter = recordedWriter
+            self.assertRaises(Crash, analyze.main, self.columns, 7, **options)
+            analyze.writeJournalsData = writeJournalsData
+            analyze.CompressedTsvWriter = CompressedTsvWriter
+            # The writer threads of a crashed process are gone before it is restarted
+            for writer in writers:
+                writer.close()
+        analyze.main(self.columns, 7, **options)
+        os.rename('tsvFiles', outputDir)
+
+    def readOutput(self, outputDir):
+        return {fileName: list(analyze.readTsv(os.path.join(outputDir, fileName)))
+                for fileName in sorted(os.listdir(outputDir))}
+
+    def assertResumeEqualsUninterrupted(self, crashes, **options):
+        self.analyze('reference', collaborationDir='collaborationReference', **options)
+        self.analyze('resumed', crashes, collaborationDir='collaboration', checkpointDir='checkpoints',
+                     checkpointInterval=10, **options)
+
+        reference = self.readOutput('reference')
+        self.assertEqual(len(reference), len(journals))
+        self.assertEqual(sum(len(rows) - 1 for rows in reference.values()), 80)
+        self.assertEqual(self.readOutput('resumed'), reference)
+
+        expected = analyze.CollaborationMatrices.load('collaborationReference')
+        collaboration = analyze.CollaborationMatrices.load('collaboration')
+        self.assertEqual(collaboration.countryPairs, expected.countryPairs)
+        self.assertEqual(collaboration.genderPairs, expected.genderPairs)
+
+    def testResumeAfterCrash(self):
+        self.assertResumeEqualsUninterrupted([5])
+
+    # The second run crashes in the other input file, after the first one was completed
+    def testResumeAfterTwoCrashes(self):
+        self.assertResumeEqualsUninterrupted([3, 6])
+
+    def testResumeCompressedOutput(self):
+        self.assertResumeEqualsUninterrupted([5], compression='gzip', compressionThreads=1)
+
+    def testCompletedRunIsSkipped(self):
+        self.analyze('first', checkpointDir='checkpoints')
+        os.mkdir('tsvFiles')
+        analyze.main(self.columns, 7, checkpointDir='checkpoints')
+        self.assertEqual(os.listdir('tsvFiles'), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
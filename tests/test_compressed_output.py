@@ -0,0 +1,62 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from support import importAnalyze
+
+analyze = None
+
+
+def setUpModule():
+    global analyze
+    analyze = importAnalyze()
+
+
+class CompressedOutputTest(unittest.TestCase):
+
+    def setUp(self):
+        self.outputDir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.outputDir)
+
+    # Every batch is its own gzip member or zstd frame, the file must read back as one table with one header
+    def roundTrip(self, compression):
+        fileName = os.path.join(self.outputDir, 'J.tsv' + analyze.compressionExtensions[compression])
+        header = ['PMID', 'JournalIso', 'Abstract']
+        writer = analyze.CompressedTsvWriter(compression, threads=2)
+        writer.write(fileName, [['1', 'J', 'First\tbatch']], header)
+        writer.write(fileName, [['2', 'J', 'Line\nbreak'], ['3', 'J', 'NA']], header)
+        writer.close()
+
+        # A later run appends to the existing file without repeating the header
+        writer = analyze.CompressedTsvWriter(compression, threads=1)
+        writer.writeChunks(fileName, ([str(pmid), 'J', 'NA'] for pmid in range(4, 9)), header, chunkSize=2)
+        writer.close()
+
+        rows = list(analyze.readTsv(fileName))
+        self.assertEqual(rows[0], header)
+        self.assertEqual(rows[1:4], [['1', 'J', 'First\tbatch'], ['2', 'J', 'Line\nbreak'], ['3', 'J', 'NA']])
+        self.assertEqual([row[0] for row in rows[1:]], [str(pmid) for pmid in range(1, 9)])
+
+    def testGzipRoundTrip(self):
+        self.roundTrip('gzip')
+
+    def testZstdRoundTrip(self):
+        if analyze.zstandard is None:
+            self.skipTest("zstandard is not installed")
+        self.roundTrip('zstd')
+
+    def testDifferentColumnsAreRefused(self):
+        fileName = os.path.join(self.outputDir, 'J.tsv.gz')
+        writer = analyze.CompressedTsvWriter('gzip', threads=1)
+        writer.write(fileName, [['1', 'J']], ['PMID', 'JournalIso'])
+        writer.close()
+        writer = analyze.CompressedTsvWriter('gzip', threads=1)
+        self.assertRaises(ValueError, writer.write, fileName, [['1']], ['PMID'])
+        writer.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import datetime
+import unittest
+
+from support import importAnalyze
+
+analyze = None
+
+
+def setUpModule():
+    global analyze
+    analyze = importAnalyze()
+
+
+def daysSinceEpoch(year, month, day):
+    return (datetime.date(year, month, day) - datetime.date(1970, 1, 1)).days
+
+
+class PubMedDateTest(unittest.TestCase):
+
+    def testEpochDayMatchesDatetime(self):
+        for year in (1600, 1899, 1900, 1970, 1999, 2000, 2024, 2100):
+            for month in range(1, 13):
+                for day in (1, 15, 28):
+                    self.assertEqual(analyze.epochDay(year, month, day), daysSinceEpoch(year, month, day))
+
+    def testNumericAndNamedMonths(self):
+        self.assertEqual(analyze.parsePubMedDate('2020', '4', '26'), daysSinceEpoch(2020, 4, 26))
+        self.assertEqual(analyze.parsePubMedDate('2020', '04', '26'), daysSinceEpoch(2020, 4, 26))
+        self.assertEqual(analyze.parsePubMedDate('2020', 'Apr', '26'), daysSinceEpoch(2020, 4, 26))
+        self.assertEqual(analyze.parsePubMedDate('2020', 'April', '26'), daysSinceEpoch(2020, 4, 26))
+        self.assertEqual(analyze.parsePubMedDate('2020', 'DEC', '31'), daysSinceEpoch(2020, 12, 31))
+
+    def testMissingDayIsFirstOfMonth(self):
+        self.assertEqual(analyze.parsePubMedDate('2020', 'Jul', None), daysSinceEpoch(2020, 7, 1))
+        self.assertEqual(analyze.parsePubMedDate('2020', '7', ''), daysSinceEpoch(2020, 7, 1))
+
+    def testLeapDay(self):
+        self.assertEqual(analyze.parsePubMedDate('2020', '2', '29'), daysSinceEpoch(2020, 2, 29))
+        self.assertEqual(analyze.parsePubMedDate('2000', 'Feb', '29'), daysSinceEpoch(2000, 2, 29))
+        self.assertIsNone(analyze.parsePubMedDate('2021', '2', '29'))
+        self.assertIsNone(analyze.parsePubMedDate('1900', '2', '29'))
+
+    def testInvalidDates(self):
+        self.assertIsNone(analyze.parsePubMedDate(None, '1', '1'))
+        self.assertIsNone(analyze.parsePubMedDate('2020', None, '1'))
+        self.assertIsNone(analyze.parsePubMedDate('20x0', '1', '1'))
+        self.assertIsNone(analyze.parsePubMedDate('2020', '13', '1'))
+        self.assertIsNone(analyze.parsePubMedDate('2020', 'Foo', '1'))
+        self.assertIsNone(analyze.parsePubMedDate('2020', '4', '31'))
+        self.assertIsNone(analyze.parsePubMedDate('2020', '4', 'x'))
+
+    def testDaysBetween(self):
+        rawDates = {'received': '2020-2-28', 'accepted': '2020-3-1', 'pubmed': 'None-None-None'}
+        epochDays = {'received': daysSinceEpoch(2020, 2, 28), 'accepted': daysSinceEpoch(2020, 3, 1), 'pubmed': None}
+        self.assertEqual(analyze.daysBetween(rawDates, epochDays, 'received', 'accepted'), 2)
+        self.assertEqual(analyze.daysBetween(rawDates, epochDays, 'accepted', 'pubmed'), "NA")
+        self.assertIsNone(analyze.daysBetween(rawDates, epochDays, 'accepted', 'revised'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from support import importAnalyze
+
+analyze = None
+
+
+def setUpModule():
+    global analyze
+    analyze = importAnalyze()
+
+
+firstAbstract = ("The aim of this study was to assess the prevalence of hypertension in adults living in rural "
+                 "areas. We found that the prevalence was high and that screening programs were insufficient.")
+nearDuplicate = ("The aim of this study was to assess the prevalence of hypertension in adults living in rural "
+                 "areas. We found that the prevalence was high and that screening programs were lacking.")
+otherAbstract = ("Zebrafish larvae were exposed to cadmium chloride and the expression of metallothionein genes "
+                 "was measured by quantitative PCR after two, four and eight days of exposure.")
+
+
+class DuplicateIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.indexDir = tempfile.mkdtemp()
+        self.index = self.openIndex()
+
+    def tearDown(self):
+        self.index.close()
+        shutil.rmtree(self.indexDir)
+
+    def openIndex(self, **settings):
+        return analyze.DuplicateIndex(os.path.join(self.indexDir, 'index.sqlite'),
+                                      os.path.join(self.indexDir, 'pairs.tsv'), **settings)
+
+    def insert(self, pmid, abstract):
+        return self.index.insert(pmid, self.index.signature(abstract))
+
+    def bucketRows(self, pmid):
+        return sorted(self.index.db.execute("SELECT band, key FROM buckets WHERE pmid = ?", (pmid,)))
+
+    def testNearDuplicatesArePaired(self):
+        self.assertEqual(self.insert('1', firstAbstract), [])
+        self.assertEqual(self.insert('2', otherAbstract), [])
+        pairs = self.insert('3', nearDuplicate)
+        self.assertEqual([pair[:2] for pair in pairs], [['1', '3']])
+        self.assertGreaterEqual(pairs[0][2], self.index.threshold)
+
+    # An update file repeating a record with the same abstract must not add buckets or report the article again
+    def testUnchangedSignatureIsSkipped(self):
+        self.insert('1', firstAbstract)
+        self.insert('2', nearDuplicate)
+        buckets = self.bucketRows('2')
+        self.assertEqual(len(buckets), self.index.bands)
+
+        self.assertEqual(self.insert('2', nearDuplicate), [])
+        self.assertEqual(self.bucketRows('2'), buckets)
+        self.assertEqual(self.index.db.execute("SELECT COUNT(*) FROM buckets").fetchone()[0], 2 * self.index.bands)
+
+    # A revised abstract replaces the old signature and its buckets, so the old neighbours are no longer found
+    def testChangedSignatureReplacesBuckets(self):
+        self.insert('1', firstAbstract)
+        self.insert('2', nearDuplicate)
+        oldBuckets = self.bucketRows('2')
+
+        self.assertEqual(self.insert('2', otherAbstract), [])
+        newBuckets = self.bucketRows('2')
+        self.assertEqual(len(newBuckets), self.index.bands)
+        self.assertNotEqual(newBuckets, oldBuckets)
+        signature = self.index.db.execute("SELECT signature FROM signatures WHERE pmid = '2'").fetchone()[0]
+        self.assertEqual(signature, self.index.signature(otherAbstract).tobytes())
+
+        # A new copy of the first abstract only pairs with the first article now
+        pairs = self.insert('3', firstAbstract)
+        self.assertEqual([pair[:2] for pair in pairs], [['1', '3']])
+
+    def testDifferentSettingsAreRefused(self):
+        self.index.close()
+        self.assertRaises(ValueError, self.openIndex, numPerm=64, bands=16)
+        self.index = self.openIndex()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import unittest
+
+from support import importAnalyze
+
+analyze = None
+
+
+def setUpModule():
+    global analyze
+    analyze = importAnalyze()
+
+
+class EnglishAbstractTest(unittest.TestCase):
+
+    def assertEnglish(self, abstract, english=True):
+        self.assertEqual(analyze.isEnglishAbstract(['fre'], abstract), english, abstract)
+
+    def testArticlesInEnglishAreEnglish(self):
+        self.assertTrue(analyze.isEnglishAbstract(['eng'], "Le but de cette étude était d'évaluer la prévalence."))
+
+    def testEnglishTranslation(self):
+        self.assertEnglish("The aim of this study was to assess the prevalence of hypertension in adults. We found "
+                           "that the prevalence was high in rural areas and that screening was insufficient.")
+
+    def testTerseStructuredEnglish(self):
+        self.assertEnglish("BACKGROUND: Hypertension prevalence in rural cohorts. METHODS: Cross-sectional survey, "
+                           "1200 adults, blood pressure measurement. RESULTS: Prevalence 32%, higher in men. "
+                           "CONCLUSIONS: Screening programs needed in rural areas.")
+        self.assertEnglish("AIMS: De-escalation of pro-inflammatory therapy. METHODS: Case series. RESULTS: Remission "
+                           "in 8 of 10. CONCLUSION: Feasible.")
+
+    def testAbbreviationsAreNotOtherLanguages(self):
+        self.assertEnglish("DES exposure in utero and LOS in the NICU: OS and EST analysis of DES daughters was "
+                           "performed.")
+        self.assertEnglish("We report de novo mutations in 12 families. The variants were absent from controls.")
+
+    def testOtherLanguages(self):
+        self.assertEnglish("Le but de cette étude était d'évaluer la prévalence de l'hypertension chez les adultes. "
+                           "Les résultats montrent que la prévalence est élevée dans les zones rurales.", False)
+        self.assertEnglish("El objetivo de este estudio fue evaluar la prevalencia de la hipertensión en los "
+                           "adultos. Los resultados muestran que la prevalencia es alta en las zonas rurales.", False)
+        self.assertEnglish("Ziel der Studie war es, die Prävalenz der Hypertonie bei Erwachsenen zu untersuchen. "
+                           "Die Ergebnisse zeigen, dass die Prävalenz in ländlichen Gebieten hoch ist.", False)
+        self.assertEnglish("O objetivo deste estudo foi avaliar a prevalência da hipertensão em adultos. Os "
+                           "resultados mostram que a prevalência é alta nas zonas rurais e que o rastreio não é "
+                           "suficiente.", False)
+
+    def testNonLatinScript(self):
+        self.assertEnglish("Целью исследования была оценка распространенности гипертонии у взрослых.", False)
+
+
+if __name__ == '__main__':
+    unittest.main()
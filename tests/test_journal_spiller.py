@@ -0,0 +1,65 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from support import importAnalyze
+
+analyze = None
+
+
+def setUpModule():
+    global analyze
+    analyze = importAnalyze()
+
+
+class JournalSpillerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.spillDir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.spillDir)
+
+    # Batches as parsePubMedArticles hands them over, the PMIDs count up in the order the articles were read
+    def batches(self):
+        journals = ['Nat Med', 'Cell Rep', None, 'J Biol', 'Cell Rep']
+        pmid = 0
+        for batchNumber in range(6):
+            journalsData = {}
+            for i in range(7):
+                journalIso = journals[(batchNumber + i) % len(journals)]
+                if journalIso not in journalsData:
+                    journalsData[journalIso] = analyze.ArticleBatch(['PMID', 'JournalIso'])
+                journalsData[journalIso].append([str(pmid), journalIso or "NA"])
+                pmid += 1
+            yield journalsData
+
+    def groups(self, memoryBudget):
+        spiller = analyze.JournalSpiller(memoryBudget, self.spillDir)
+        for journalsData in self.batches():
+            spiller.add(journalsData)
+        runFiles = len(spiller.runFiles)
+        return [(journalIso, list(rows)) for journalIso, rows in spiller.groups()], runFiles
+
+    def testGroupsAreSortedAndKeepTheirOrder(self):
+        groups, runFiles = self.groups(10 ** 9)
+        self.assertEqual(runFiles, 0)
+        self.assertEqual([journalIso for journalIso, rows in groups], [None, 'Cell Rep', 'J Biol', 'Nat Med'])
+        for journalIso, rows in groups:
+            pmids = [int(row[0]) for row in rows]
+            self.assertEqual(pmids, sorted(pmids))
+            self.assertEqual({row[1] for row in rows}, {journalIso or "NA"})
+        self.assertEqual(sum(len(rows) for journalIso, rows in groups), 42)
+
+    # Spilling every batch to its own run file must merge back to exactly the same groups
+    def testSpilledRunsMergeLikeMemory(self):
+        inMemory, runFiles = self.groups(10 ** 9)
+        spilled, runFiles = self.groups(1)
+        self.assertEqual(runFiles, 6)
+        self.assertEqual(spilled, inMemory)
+        self.assertEqual(os.listdir(self.spillDir), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from support import importAnalyze
+
+analyze = None
+
+
+def setUpModule():
+    global analyze
+    analyze = importAnalyze()
+
+
+class LeaseQueueTest(unittest.TestCase):
+
+    def setUp(self):
+        self.queueDir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.queueDir)
+
+    # A worker that stopped sending heartbeats, its lease expires after leaseTime
+    def deadLease(self, leaseTime=0.2):
+        lease = analyze.FileLease(self.queueDir, 'pubmed24n0001.xml.gz', 'dead', leaseTime)
+        self.assertTrue(lease.acquire())
+        lease.stopped.set()
+        lease.heartbeatThread.join()
+        return lease
+
+    def testLiveLeaseIsExclusive(self):
+        first = analyze.FileLease(self.queueDir, 'pubmed24n0001.xml.gz', 'worker1', 5)
+        second = analyze.FileLease(self.queueDir, 'pubmed24n0001.xml.gz', 'worker2', 5)
+        self.assertTrue(first.acquire())
+        self.assertFalse(second.acquire())
+        first.release()
+        self.assertTrue(second.acquire())
+        second.release()
+        self.assertEqual(os.listdir(self.queueDir), [])
+
+    def testExpiredLeaseIsReclaimed(self):
+        dead = self.deadLease()
+        worker = analyze.FileLease(self.queueDir, 'pubmed24n0001.xml.gz', 'worker1', 5)
+        self.assertFalse(worker.acquire())
+        time.sleep(0.3)
+        self.assertTrue(worker.acquire())
+        self.assertFalse(dead.held())
+        self.assertTrue(worker.held())
+        worker.release()
+
+    # Worker 2 reads the expired lease, worker 1 reclaims it first, then worker 2 goes on with what it read
+    def testStaleReadDoesNotReclaimFreshLease(self):
+        self.deadLease()
+        time.sleep(0.3)
+        worker1 = analyze.FileLease(self.queueDir, 'pubmed24n0001.xml.gz', 'worker1', 5)
+        worker2 = analyze.FileLease(self.queueDir, 'pubmed24n0001.xml.gz', 'worker2', 5)
+        staleLease = worker2.readLease()
+        readLease = worker2.readLease
+        reads = []
+
+        def readStaleFirst():
+            reads.append(None)
+            return staleLease if len(reads) == 1 else readLease()
+
+        worker2.readLease = readStaleFirst
+        self.assertTrue(worker1.acquire())
+        self.assertFalse(worker2.acquire())
+        self.assertTrue(worker1.held())
+        worker1.release()
+
+    def testHeartbeatNoticesLostLease(self):
+        dead = analyze.FileLease(self.queueDir, 'pubmed24n0001.xml.gz', 'dead', 0.3)
+        self.assertTrue(dead.acquire())
+        # Stall the worker long enough for its lease to expire, then let its heartbeat run again
+        dead.stopped.set()
+        dead.heartbeatThread.join()
+        time.sleep(0.4)
+        worker = analyze.FileLease(self.queueDir, 'pubmed24n0001.xml.gz', 'worker1', 5)
+        self.assertTrue(worker.acquire())
+        dead.stopped.clear()
+        dead.heartbeat()
+        self.assertTrue(dead.lost.is_set())
+        self.assertRaises(analyze.LeaseLost, analyze.checkLease, dead)
+        analyze.checkLease(worker)
+        worker.release()
+
+    def testClaimInputFilesSkipsCompleteFiles(self):
+        checkpointDir = os.path.join(self.queueDir, 'checkpoints')
+        os.makedirs(checkpointDir)
+        analyze.saveCheckpoint(os.path.join(checkpointDir, 'pubmed24n0001.xml.gz.json'), 'pubmed24n0001.xml.gz',
+                               10, {}, complete=True)
+        claimed = []
+        for inputFile, lease in analyze.claimInputFiles(['pubmed24n0001.xml.gz', 'pubmed24n0002.xml.gz'],
+                                                        self.queueDir, checkpointDir, 'worker1', 5):
+            self.assertTrue(lease.held())
+            claimed.append(inputFile)
+            analyze.saveCheckpoint(os.path.join(checkpointDir, inputFile + '.json'), inputFile, 10, {},
+                                   complete=True)
+        self.assertEqual(claimed, ['pubmed24n0002.xml.gz'])
+
+    def testMergeShardsRefusesToMergeTwice(self):
+        shardRoot = os.path.join(self.queueDir, 'tsvShards')
+        outputDir = os.path.join(self.queueDir, 'tsvFiles')
+        os.makedirs(os.path.join(shardRoot, 'worker1'))
+        os.makedirs(outputDir)
+        analyze.writeToTsv(os.path.join(shardRoot, 'worker1', 'Nat_Med.tsv'), [['1', 'Nat Med']], ['PMID', 'JournalIso'])
+        analyze.mergeShards(shardRoot, outputDir)
+        self.assertRaises(ValueError, analyze.mergeShards, shardRoot, outputDir)
+        self.assertEqual(len(list(analyze.readTsv(os.path.join(outputDir, 'Nat_Med.tsv')))), 2)
+
+    # A worker that lost its lease removes the files it created since its checkpoint, writing them again
+    # afterwards must start them with their header row
+    def testRestoredFilesGetTheirHeaderBack(self):
+        outputDir = os.path.join(self.queueDir, 'tsvFiles')
+        os.makedirs(outputDir)
+        restorePoint = {'outputDir': outputDir, 'offsets': analyze.outputSizes(outputDir)}
+        fileName = os.path.join(outputDir, 'J.tsv.gz')
+        writer = analyze.CompressedTsvWriter('gzip', threads=1)
+        writer.write(fileName, [['1', 'J']], ['PMID', 'JournalIso'])
+        writer.flush()
+        writer.forget(analyze.restoreCheckpoint(restorePoint))
+        self.assertFalse(os.path.exists(fileName))
+        writer.write(fileName, [['2', 'J']], ['PMID', 'JournalIso'])
+        writer.close()
+        self.assertEqual(list(analyze.readTsv(fileName)), [['PMID', 'JournalIso'], ['2', 'J']])
+
+
+if __name__ == '__main__':
+    unittest.main()